@@ -7,9 +7,35 @@
   * それ以外           : PATTERN_MAPPING & CLIP_REGEX でマッピング
 - `出力日時` を追加し Shift_JIS+Tab で保存
 
+オプション (kwargs):
+- vectorized=True    : 種別ごとにまとめて Series.str で一括変換（結果は行単位と同一）
+- cache=True         : output_path と同じ場所の SQLite に変換結果を保存し、次回以降は再利用
+  (cache_path / cache_size で保存先と最大件数を変更可)
+- incremental=True   : 前回実行のマニフェスト（<output_path>.manifest.json）と比べ、
+  追加・変更された行だけを変換して前回の出力とマージする
+- chunksize=N        : N 行ずつ読み込み→変換→追記するストリーミング処理（メモリ一定）。
+  返り値の 1 つ目は全行ではなく種別ごとの件数サマリ。途中のチャンクで失敗したときは
+  出力（TSV / parquet / arrow）を書き換えない。空の入力（ヘッダー行も無い）は ValueError
+- workers=N          : shard_size 行（既定 20000）ずつプロセスプールで並列変換。行順は入力どおり
+- output_format=...  : "parquet" / "arrow"（カンマ区切りで両方も可）。Shift_JIS の TSV に加えて
+  <output_path の拡張子違い>.parquet / .arrow も書き出す（全列文字列・種別は辞書エンコード・
+  文字の欠落なし。arrow は非圧縮の IPC ファイルなので memory_map で読める）。要 pyarrow
+- stats=True         : 種別ごとの件数・時間、PATTERN_MAPPING のルールごとの評価・ヒット数、
+  CLIP_REGEX / DEFAULT_FILL へのフォールスルー数、表記揺れ・あいまい一致で見つかったシリーズ名
+  （確信度つき）を集計し、返り値の 3 つ目の DataFrame と
+  conversion_stats_<日時>.tsv に出力（cache / incremental 時は実際に変換した行だけが対象）
+- shadow="vectorized" : 出力はそのままに、同じフレームを現行の行単位変換と候補エンジン
+  （vectorized / workers / workers_vectorized）で変換して比べ、差分を種別・ルールごとに表示して
+  shadow_diff_<日時>.tsv に出力（速度比・メモリ比も表示。shadow_memory=False でメモリ計測を省く）。
+  chunksize とは併用不可。コーパスでの一括検証は python -m utils.shadow_run
+- compact=True       : 省メモリの列で保持する（種別・出力日時は category、名称・変換後は
+  Arrow 実装の文字列。出力日時は全行ぶんの文字列を持たず、書き出し時に展開）。
+  出力ファイルは同じ。返り値の DataFrame の dtype だけが変わる。chunksize 時は無関係
+
 依存:
-- utils.mapping_config  : PATTERN_MAPPING, CLIP_REGEX
-- utils.comic_parser    : parse_comic_name, format_comic
+- utils.title_normalizer : 変換ロジック本体（convert_rows / convert_vectorized / ...）
+- utils.rule_engine     : mapping_config のコンパイル済みルール（変更時のみ再読み込み）
+- utils.comic_parser    : tokenize, format_comic
 """
 
 if 'transformer' not in globals():
@@ -19,23 +45,196 @@ if 'test' not in globals():
 
 import pandas as pd
 import os
-import re
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-import importlib
-import chardet
-import unicodedata
+from functools import partial
+
+# --- ユーティリティ読み込み（ソースが変わったときだけリロード）---
+import utils.comic_parser as cp
+import utils.title_normalizer as tn
+from utils import rule_engine
+rule_engine.reload_if_changed(cp, tn)
+
+from utils.title_cache import ESC, YMD, YYMMDD, TitleCache
+from utils.conversion_stats import ConversionStats
+from utils.columnar_output import FORMATS, ColumnarWriter, parse_formats, write_columnar
+from utils.compact_frame import SLICE_ROWS, compact_frame, compact_strings, concat_strings, constant_column
+from utils.row_manifest import RowManifest
+from utils.tsv_loader import read_tsv, sniff_encoding
+
+class _FrameConverter:
+    """kwargs に応じた経路（行単位 / vectorized / 並列 / キャッシュ）でフレームを変換する。
+
+    キャッシュとプロセスプールは 1 回の実行につき 1 つだけ開き、スライス・チャンクをまたいで使い回す。
+    """
+
+    def __init__(self, output_path: str, kwargs: dict, stats=None):
+        self.cache = _open_cache(output_path, kwargs)
+        self.pool = None
+        self.convert_many = partial(tn.convert_vectorized if kwargs.get('vectorized') else tn.convert_rows,
+                                    stats=stats)
+        if kwargs.get('workers') and int(kwargs['workers']) > 1:
+            workers = int(kwargs['workers'])
+            self.pool = ProcessPoolExecutor(max_workers=workers)     # ワーカーは最初のシャードで起動
+            self.convert_many = partial(
+                tn.convert_parallel,
+                workers=workers,
+                shard_size=int(kwargs.get('shard_size') or tn.DEFAULT_SHARD_SIZE),
+                vectorized=bool(kwargs.get('vectorized')),
+                stats=stats,
+                pool=self.pool,
+            )
+
+    def __call__(self, df: pd.DataFrame):
+        kinds, names = tn.key_columns(df)
+        if self.cache is None:
+            return self.convert_many(kinds, names)
+        return tn.convert_cached(kinds, names, self.cache, self.convert_many)
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown()
+        if self.cache is not None:
+            self.cache.close()
+            print(f"[CACHE] hit {self.cache.hits} / miss {self.cache.misses} → {self.cache.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _convert_frame(df: pd.DataFrame, output_path: str, kwargs: dict, stats=None):
+    """df を 1 回だけ変換する（キャッシュ・プールはこの呼び出しの中で開いて閉じる）。"""
+    with _FrameConverter(output_path, kwargs, stats) as convert:
+        return convert(df)
+
+
+def _open_cache(output_path: str, kwargs: dict):
+    if not kwargs.get('cache'):
+        return None
+    options = {}
+    if kwargs.get('cache_size'):
+        options['max_entries'] = int(kwargs['cache_size'])
+    fingerprint = rule_engine.current().fingerprint
+    if kwargs.get('cache_path'):
+        return TitleCache(kwargs['cache_path'], fingerprint, tn.CACHE_NAMESPACE, **options)
+    return TitleCache.beside(output_path, fingerprint, tn.CACHE_NAMESPACE, **options)
+
+
+def _write_unknown_log(unknown_series: set, output_path: str) -> None:
+    if unknown_series:
+        log_dir  = os.path.dirname(output_path)
+        ts       = datetime.now().strftime('%Y%m%d-%H%M%S')
+        log_path = os.path.join(log_dir, f"unknown_series_{ts}.log")
+        with open(log_path, 'w', encoding='utf-8') as f:
+            for s in sorted(unknown_series):
+                f.write(s + '\n')
+        print(f"[LOG] 未登録シリーズ {len(unknown_series)} 件 → {log_path}")
+    else:
+        print('[LOG] 未登録シリーズはありません')
+
+
+def _stats_frame(stats, output_path: str) -> pd.DataFrame:
+    """集計結果を DataFrame にしてファイルにも書き出す。"""
+    rules = rule_engine.current()
+    path = stats.save(os.path.dirname(output_path), rules)
+    if path:
+        print(f"[STATS] → {path}")
+    return stats.to_frame(rules)
+
+
+def _convert_compact(df: pd.DataFrame, output_path: str, kwargs: dict, stats, now: datetime):
+    """compact=True 用: SLICE_ROWS 行ずつ変換し、日付を展開して Arrow 文字列に詰める。
+
+    (変換後, 未登録シリーズの集合) を返す。object の変換結果は 1 スライス分しか持たない
+    （その代わり、同じ名称の重複除去・メモ化もスライスの中だけになる）。
+    """
+    parts, unknown_series = [], set()
+    with _FrameConverter(output_path, kwargs, stats) as convert:
+        for start in range(0, len(df), SLICE_ROWS):
+            templates, unknown = convert(df.iloc[start:start + SLICE_ROWS])
+            unknown_series.update(unknown.dropna())
+            parts.append(tn.render_templates(compact_strings(templates), now))
+            del templates, unknown
+    return concat_strings(parts, df.index), unknown_series
+
+
+def _shadow(df: pd.DataFrame, output_path: str, kwargs: dict, now: datetime) -> None:
+    """現行の変換と候補エンジンの結果を比べて表示する（df・出力には触れない）。"""
+    from utils.shadow_run import shadow_compare
 
-# --- ユーティリティ読み込み & 強制リロード ---
-import utils.mapping_config as map_cfg
-importlib.reload(map_cfg)
-import importlib, utils.comic_parser as cp; importlib.reload(cp)
+    candidate = kwargs['shadow'] if isinstance(kwargs['shadow'], str) else 'vectorized'
+    kinds, names = tn.key_columns(df)
+    report = shadow_compare(kinds, names, candidate, memory=bool(kwargs.get('shadow_memory', True)), now=now)
+    print(report.summary())
+    path = report.save(os.path.dirname(output_path))
+    if path:
+        print(f"[SHADOW] 差分 → {path}")
 
-from utils.comic_parser import parse_comic_name, format_comic
 
-PATTERN_MAPPING = getattr(map_cfg, 'PATTERN_MAPPING', {})
-CLIP_REGEX = getattr(map_cfg, 'CLIP_REGEX', {})
-PREFIX_MAPPING   = getattr(map_cfg, 'PREFIX_MAPPING', {})
-DEFAULT_FILL = datetime.today().strftime('%Y%m%d')
+def _normalize_streaming(input_path: str, output_path: str, chunksize: int, kwargs: dict):
+    """chunksize 行ずつ変換して output_path へ追記する。全行はメモリに持たない。"""
+    if kwargs.get('incremental'):
+        raise ValueError('chunksize と incremental は同時に指定できません')
+    if kwargs.get('shadow'):
+        raise ValueError('chunksize と shadow は同時に指定できません')
+
+    formats = parse_formats(kwargs.get('output_format'))
+    encoding = sniff_encoding(input_path)
+    unknown_series = set()
+    counts: dict = {}
+    stats = ConversionStats() if kwargs.get('stats') else None
+    now = datetime.now()
+    stamp = now.strftime('%Y-%m-%d %H:%M:%S')
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    try:
+        reader = pd.read_csv(input_path, sep='\t', encoding=encoding, encoding_errors='ignore',
+                             chunksize=chunksize)
+    except pd.errors.EmptyDataError:
+        raise ValueError(f'入力が空です（ヘッダー行もありません）: {input_path}') from None
+    # TSV も一時ファイルへ書き、最後まで変換できたときだけ置き換える（途中で落ちても前回の出力が残る）
+    tmp_path = output_path + '.tmp'
+    first = True
+    try:
+        with reader, ColumnarWriter(output_path, formats) as columnar, \
+                _FrameConverter(output_path, kwargs, stats) as convert:   # プール・キャッシュは全チャンクで共有
+            for chunk in reader:
+                if first and {'種別', '名称'} - set(chunk.columns):
+                    raise ValueError('必須列「種別」「名称」が不足しています')
+
+                templates, unknown = convert(chunk)
+                unknown_series.update(unknown.dropna())
+                chunk['変換後'] = tn.render_templates(templates, now)
+                chunk['出力日時'] = stamp
+                for kind, n in chunk['種別'].astype(object).map(str).str.strip().value_counts(sort=False).items():
+                    counts[kind] = counts.get(kind, 0) + int(n)
+
+                chunk.to_csv(tmp_path, sep='\t', index=False, encoding='shift_jis', errors='ignore',
+                             mode='w' if first else 'a', header=first)
+                columnar.write(chunk)
+                first = False
+            if first:
+                raise ValueError(f'入力が空です（ヘッダー行もありません）: {input_path}')
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    for path in columnar.paths.values():
+        print(f"[OUT] {path}")
+
+    total = sum(counts.values())
+    print(f"[STREAM] {total} 行 ({encoding}) → {output_path}")
+    summary_df = pd.DataFrame({'種別': list(counts), '件数': list(counts.values())})
+    log_df = pd.DataFrame({'未登録シリーズ候補': sorted(unknown_series)})
+    _write_unknown_log(unknown_series, output_path)
+    if stats is not None:
+        return [summary_df, log_df, _stats_frame(stats, output_path)]
+    return [summary_df, log_df]
+
 
 @transformer
 def normalize_titles(data, *args, **kwargs):
@@ -48,148 +247,104 @@ def normalize_titles(data, *args, **kwargs):
     if not os.path.exists(input_path):
         raise FileNotFoundError(input_path)
 
-    # df = pd.read_csv(input_path, sep='\t', encoding='utf-8')
-    try:
-        df = pd.read_csv(input_path, sep='\t', encoding='utf-8')
-    except UnicodeDecodeError:
-        # 1) まず CP932 / Shift_JIS で再試行
-        try:
-            df = pd.read_csv(input_path, sep='\t', encoding='cp932')
-        except UnicodeDecodeError:
-            # 2) さらに自動判定（chardet）
-            with open(input_path, 'rb') as f:
-                raw = f.read(4096)
-            enc = chardet.detect(raw)['encoding'] or 'utf-8'
-            df = pd.read_csv(input_path, sep='\t', encoding=enc, errors='ignore')
+    if kwargs.get('chunksize'):
+        return _normalize_streaming(input_path, output_path, int(kwargs['chunksize']), kwargs)
+
+    # 1 回だけ読み込み、BOM → utf-8 → cp932 → chardet の順で判定してデコード
+    df, load_info = read_tsv(input_path)
+    print(f"[LOAD] {load_info.summary()}")
 
     if {'種別', '名称'} - set(df.columns):
         raise ValueError('必須列「種別」「名称」が不足しています')
-    
+    formats = parse_formats(kwargs.get('output_format'))
+    compact = bool(kwargs.get('compact'))
+    if compact:
+        compact_frame(df)
+
     unknown_series = set()          # ★ 変換できなかったシリーズの一時保管
+    stats = ConversionStats() if kwargs.get('stats') else None
 
-    def _normalize_series(s: str) -> str:
-        # ① 全角ハイフン・長音・ダッシュ類 → 半角ハイフン
-        s = re.sub(r'[―ー−–－]', '-', s)
-        # ② ハイフン前後を空白に置換して“単語区切り”へ
-        s = s.replace('-', ' ')
-        # ③ 全角空白 → 半角空白、連続空白 → 1 個
-        s = unicodedata.normalize('NFKC', s)
-        s = re.sub(r'\s+', ' ', s).strip()
-        return s
-
-    def convert(row):
-        kind = str(row['種別']).strip()
-        name = str(row['名称']).strip()
-        tag   = PREFIX_MAPPING.get(kind, 'def')  # 先頭に付与するタグ（無ければdef）
-
-        name_norm = _normalize_series(name)
-
-        # ---（変換せずそのまま出力） ----
-        if tag in {"def"}:
-            return name
-        # --- 設定資料 ---------------------------------------
-        if kind in {"その他", "小説"}:
-            return f"{tag}{name}" if tag else name
-        # --- 設定資料 ---------------------------------------
-        if kind == "美術":
-            info   = parse_comic_name(name)      # [作者] があれば拾う
-            author = info["author"] or ""        # 無ければ空文字
-            title  = info["title"]  or name      # タイトルはそのまま
-            today  = datetime.today().strftime("%Y%m%d")
-            # [作者] が取れたら `[作者][出版社](不明)`、無ければ `[出版社](不明)`
-            prefix = f"[{author}][出版社]({today})" if author else f"[作者][出版社]({today})"
-            return f"{tag}{prefix}{title}" if tag else f"{prefix}{title}"
-        # --- コミック / CG ---------------------------------
-        if kind == "コミック":
-            info = parse_comic_name(name)
-            title  = format_comic(info)
-            return title
-        # --- 成年 ------------------------------------------
-        if kind in {"成年コミック", "電子成年コミック"}:
-            info = parse_comic_name(name)
-            author = info["author"] or ""
-            title  = info["title"]  or name
-            today  = datetime.today().strftime("%y%m%d")
-            fixed  = f"[出版社](20{today})"
-            return f"{tag}[{author}]{fixed}{title}"
-        # --- 同人（イベント名抽出）---------------------------
-        if kind in {"同人", "電子同人"}:
-            clean_name = cp._TAG_RE.sub('', name).strip()
-            # 例: ... (サンクリ2024)  /  (COMIC1☆25) ...
-            m_evt = re.search(r"\(([^)]*(サンクリ|例大祭|COMIC|C\d+)[^)]*)\)", name, re.IGNORECASE)
-
-            if m_evt:
-                event = m_evt.group(1)  # 例: C105, COMIC1☆25
-            else:
-                # 2) yyyy-mm-dd フォーマットを探す
-                d = re.search(r"\d{4}-\d{2}-\d{2}", clean_name)
-                event = d.group(0).replace('-', '') if d else "イベント不明"
-
-            # ③ シリーズ名＝最後の (…) を抽出
-            m_ser = re.search(r"\(([^()]+)\)(?!.*\([^()]*\))", clean_name)
-            series_raw = m_ser.group(1).strip() if m_ser else ""
-
-            series_short = map_cfg.SERIES_MAPPING.get(series_raw, series_raw)
-            if series_raw == series_short:
-                unknown_series.add(series_raw)
-
-            # ⑤ 作者・タイトル
-            info   = parse_comic_name(clean_name)
-            author = info["author"] or ""
-            title  = info["title"] or clean_name
-            if series_raw:                          # タイトル末尾の (シリーズ名) を除去
-                title = re.sub(r'\s*\(' + re.escape(series_raw) + r'\)\s*$', '', title).strip()
-            
-            out = f"{tag}[{author}]({event}){title}"
-            if series_short:
-                out += f" ({series_short})"
-            return out
-
-        # --- その他（マッピング ＋ クリップ）---------------
-        for pattern, fmt in PATTERN_MAPPING.get(kind, []):
-            m = re.search(pattern, name)
-            if m:
-                try:
-                    mapped = fmt.format(*m.groups())
-                    if kind == "成年雑誌":
-                        # 月を 2 桁 0 埋め
-                        mapped = re.sub(r'年(\d{1,2})月', lambda m: f'年{int(m.group(1)):02d}月', mapped)
-                        mapped = re.sub(r'-(\d{1,2})', lambda m: f'-{int(m.group(1)):02d}', mapped)
-                    if kind == "雑誌":
-                        info  = parse_comic_name(name)
-                        title  = info["title"]  or name
-                        mapped = f"{mapped} {title}"
-                    return f"{tag}{mapped}" if tag else mapped
-                except IndexError:
-                    continue
-
-        if kind in CLIP_REGEX:
-            pattern, grp = CLIP_REGEX[kind]
-            m = re.search(pattern, name)
-            if m:
-                base = m.group(grp)
-                return f"{tag}{base}" if tag else base
-        return DEFAULT_FILL
-
-    df['変換後'] = df.apply(convert, axis=1)
-    df['出力日時'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    now = datetime.now()
+    stamp = now.strftime('%Y-%m-%d %H:%M:%S')
+
+    if kwargs.get('incremental'):
+        # --- 差分モード：追加・変更行だけ変換し、残りは前回の出力を使う ---
+        manifest = RowManifest.beside(output_path, rule_engine.current().fingerprint)
+        keys, fps = RowManifest.fingerprint(df)
+        delta = manifest.diff(keys, fps)
+        print(f"[DELTA] {delta.summary()}")
+
+        converted = pd.Series(None, index=df.index, dtype=object)
+        stamps = pd.Series(stamp, index=df.index, dtype=object)
+        unknown = pd.Series(None, index=df.index, dtype=object)
+        if delta.todo.any():
+            templates, unk = _convert_frame(df[delta.todo], output_path, kwargs, stats)
+            converted[delta.todo] = tn.render_templates(templates, now)
+            unknown[delta.todo] = unk.where(unk.notna(), None)
+        kept = ~delta.todo
+        if kept.any():
+            prev = manifest.previous([k for k, t in zip(keys, delta.todo) if not t])
+            converted[kept] = [p[1] for p in prev]
+            stamps[kept] = [p[2] for p in prev]
+            unknown[kept] = [p[3] for p in prev]
+
+        df['変換後'] = compact_strings(converted) if compact else converted
+        df['出力日時'] = stamps.astype('category') if compact else stamps
+        unknown_series.update(unknown.dropna())
+        rewrite = delta.has_changes or not os.path.exists(output_path)
+        manifest.replace(keys, fps, df['変換後'], df['出力日時'], unknown)
+    else:
+        if compact:
+            df['変換後'], unknown = _convert_compact(df, output_path, kwargs, stats, now)
+            unknown_series.update(unknown)
+            df['出力日時'] = constant_column(stamp, df.index)
+        else:
+            templates, unknown = _convert_frame(df, output_path, kwargs, stats)
+            unknown_series.update(unknown.dropna())
+            df['変換後'] = tn.render_templates(templates, now)
+            df['出力日時'] = stamp
+        manifest, rewrite = None, True
+
+    if kwargs.get('shadow'):
+        _shadow(df, output_path, kwargs, now)
 
     # ★ 未登録シリーズを DataFrame 化（空なら行ゼロ）
     log_df = pd.DataFrame({'未登録シリーズ候補': sorted(unknown_series)})
 
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    df.to_csv(output_path, sep='\t', index=False, encoding='shift_jis', errors='ignore')
+    if rewrite:
+        df.to_csv(output_path, sep='\t', index=False, encoding='shift_jis', errors='ignore')
+    else:
+        print(f"[DELTA] 変更が無いため {output_path} は書き換えません")
+    missing = [f for f in formats if not os.path.exists(os.path.splitext(output_path)[0] + FORMATS[f])]
+    for path in write_columnar(df, output_path, formats if rewrite else missing).values():
+        print(f"[OUT] {path}")
+    if manifest is not None:
+        manifest.save()
 
     # --- Unknown シリーズをログファイルへ ----------------------
-    if unknown_series:
-        log_dir  = os.path.dirname(output_path)
-        ts       = datetime.now().strftime('%Y%m%d-%H%M%S')
-        log_path = os.path.join(log_dir, f"unknown_series_{ts}.log")
-        with open(log_path, 'w', encoding='utf-8') as f:
-            for s in sorted(unknown_series):
-                f.write(s + '\n')
-        print(f"[LOG] 未登録シリーズ {len(unknown_series)} 件 → {log_path}")
-    else:
-        print('[LOG] 未登録シリーズはありません')
+    _write_unknown_log(unknown_series, output_path)
 
+    if stats is not None:
+        return [df[['種別', '名称', '変換後', '出力日時']], log_df, _stats_frame(stats, output_path)]
     return [df[['種別', '名称', '変換後', '出力日時']], log_df]
+
+
+
+
+@test
+def test_output(output, *args, **_):
+    """返り値の形と、名称に無い日付トークン（U+E000 / U+E001 / ESC）が変換後に残っていないこと。"""
+    if isinstance(output, list):                # 返り値をリストのまま渡された場合
+        output, *args = output
+    assert isinstance(output, pd.DataFrame), 'Output is not DataFrame'
+    if args:
+        assert '未登録シリーズ候補' in args[0].columns
+    if '変換後' not in output.columns:          # chunksize: 種別ごとの件数サマリ
+        assert list(output.columns) == ['種別', '件数'], list(output.columns)
+        return
+    tokens = f"[{YMD}{YYMMDD}{ESC}]"
+    names = output['名称'].astype(object).where(output['名称'].notna(), '').astype(str)
+    converted = output['変換後'].astype(object).where(output['変換後'].notna(), '').astype(str)
+    leaked = converted.str.contains(tokens) & ~names.str.contains(tokens)
+    assert not leaked.any(), f"日付トークンが展開されていません: {converted[leaked].head().tolist()}"
@@ -4,13 +4,43 @@ from __future__ import annotations
 PDF → CSV 変換ブロック（複数 PDF & 複数ページ対応版）
 =====================================================
 * **input/** 配下にあるすべての `*.pdf` を探索し、**全ページ**から見つかった
-  すべてのテーブルを抽出して 1 つの `DataFrame` にまとめます。
+  すべてのテーブルを抽出して 1 つの `DataFrame` にまとめます。
 * 各 PDF ごとにまとめた結果を **output/** に `<元ファイル名>.csv` として
-  UTF‑8 (BOM付き) で保存します。
+  UTF‑8 (BOM付き) で保存します。
 * 行内がすべて空（空白 / 空文字 / NaN）の行は取り除いてから書き出します。
 * 失敗したファイルはスキップし、原因をコンソールへ出力して処理を継続します。
 * 返り値は、処理できたすべての PDF から得た DataFrame を行方向で連結した
   単一の `DataFrame` です（列が合わない場合は外部結合）。
+  連結は PDF が終わるたびに output/_merged.csv へ追記しながら行い（列は初出順の和集合）、
+  最後にそれを 1 回読み込んで返すので、途中で全 PDF の表を同時に持つことはありません
+  （返す DataFrame 自体は全 PDF の行を持ちます）。
+  - merge="file" : 結合結果を読み込まず、ファイルごとの件数サマリ（file / status / pages /
+    rows）を返します（結合結果は output/_merged.csv）。メモリが最大の PDF 1 つ分で
+    収まるのはこちらだけです。巨大な入力では merge="file" にしてください。
+  - input/_merged.pdf は出力が結合結果と重なるので、あれば ValueError で止めます。
+* PDF はプロセスプールで並列に処理します（ファイル名順に結合するので結果は毎回同じ）。
+  - workers : 並列数（既定は CPU コア数、1 で逐次処理）
+  - timeout : 1 ファイルあたりの制限秒数（超えたら `_error.txt` を残してスキップ）。
+    ブロックがメインスレッド以外で動くときは workers=1 でもワーカープロセスで処理して制限を掛ける
+    （SIGALRM の無い OS では効かず、その旨をファイルごとに表示）
+* 抽出結果は output/.pdf_manifest.json に記録し、前回から変わっていない PDF は
+  camelot を呼ばずに output/<元ファイル名>.csv を読み直して使います。
+  - fast_fingerprint : 内容ハッシュの代わりにサイズ + mtime で変更を判定
+  - skip_failed      : 前回失敗した PDF も未変更なら再抽出しない（既定では毎回再抽出）
+  - force            : キャッシュを使わずすべて再抽出
+  ワーカーが落ちた・プールが壊れたときの PDF（status "crashed"）は `_error.txt` だけ残し、
+  マニフェストには記録しません（次回また抽出します）。
+* page_batch=N を指定すると N ページずつ抽出して CSV に追記し、その都度メモリから解放します
+  （巨大な PDF 向け。結合用の DataFrame は書き出した CSV から読み直します）。
+* output_format="parquet" / "arrow"（カンマ区切りで両方も可）を指定すると、CSV に加えて
+  output/<元ファイル名>.parquet / .arrow も書き出します（全列文字列、要 pyarrow）。
+  キャッシュを使った PDF は、該当ファイルが無いときだけ書き出します。
+* 既定では camelot の前に各ページのテキスト・罫線（パス）・画像の有無を軽く調べ、
+  表がありそうなページだけを camelot に渡します（選んだページはログに出力）。
+  prescan=False で従来どおり全ページを渡します。
+* 真偽値の引数は文字列でも指定できます（"true" / "false" / "1" / "0" / "yes" / "no" / "on" / "off"）。
+* root="<dir>" を指定すると cwd の代わりに <dir>/input → <dir>/output を処理します
+  （utils.watcher のように cwd を変えずに呼び出す場合）。
 
 依存パッケージ:
     pip install "camelot-py[cv]" pandas
@@ -23,63 +53,128 @@ if 'test' not in globals():
     from mage_ai.data_preparation.decorators import test
 
 from pathlib import Path
-import traceback
-import camelot  # type: ignore
+import time
 import pandas as pd
 
+from utils.pdf_extractor import ExtractResult, extract_params, iter_extract
+from utils.pdf_manifest import PdfManifest, load_cached_csv
+from utils.pdf_merge import TableMerger, merged_path
+from utils.columnar_output import FORMATS, parse_formats, write_columnar
 
-@transformer
-def pdf_to_csv_fixed(*_, **__) -> pd.DataFrame:
-    """Walk through every PDF under input/, extract all tables, save and merge."""
 
-    root = Path.cwd()
-    in_dir = root / "input"
-    out_dir = root / "output"
-    out_dir.mkdir(exist_ok=True)
+_TRUE = ('1', 'true', 'yes', 'on')
+_FALSE = ('0', 'false', 'no', 'off')
 
-    merged: list[pd.DataFrame] = []
 
-    for pdf_path in in_dir.glob("*.pdf"):
-        try:
-            # ---- 全ページの表を抽出 ----
-            tables = camelot.read_pdf(str(pdf_path), pages="all")
-            if not tables:
-                print(f"⚠️  No tables found in {pdf_path.relative_to(root)} — skipped")
-                continue
+def _flag(kwargs: dict, key: str, default: bool = False) -> bool:
+    """真偽値の kwargs。パイプライン変数から文字列で渡る "False" / "0" も False と読む。"""
+    value = kwargs.get(key, default)
+    if value is None or value == '':
+        return default
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text not in _TRUE + _FALSE:
+            raise ValueError(f"{key} に指定できるのは true / false です: {value}")
+        return text in _TRUE
+    return bool(value)
 
-            # ---- 同 PDF から得たテーブルを結合 ----
-            dfs = [t.df for t in tables]
-            df_pdf = pd.concat(dfs, ignore_index=True)
-            # 空白セル → NA 置換後、全列 NA 行を除外
-            df_pdf = (
-                df_pdf.replace(r"^\s*$", pd.NA, regex=True)
-                      .dropna(how="all")
-            )
-            if df_pdf.empty:
-                print(f"⚠️  Only blank rows in {pdf_path.name} — skipped")
-                continue
 
-            # ---- CSV 書き出し ----
-            csv_path = out_dir / f"{pdf_path.stem}.csv"
-            df_pdf.to_csv(csv_path, index=False, encoding="utf-8-sig")
-            print(f"✅  CSV written → {csv_path.relative_to(root)}")
+def _write_columnar(r: ExtractResult, formats: list, root: Path, fresh: bool) -> None:
+    """抽出し直した PDF、または parquet / arrow がまだ無い PDF の列指向ファイルを書く。"""
+    if not formats or r.status != 'ok' or not r.csv_path:
+        return
+    stem = r.csv_path.with_suffix('')
+    if not fresh and all(stem.with_suffix(FORMATS[f]).exists() for f in formats):
+        return
+    df = r.df if r.df is not None else load_cached_csv(r.csv_path)     # page_batch で書き出した分
+    for path in write_columnar(df, str(r.csv_path), formats, dictionary_columns=()).values():
+        print(f"🗂  Columnar written → {Path(path).relative_to(root)}")
 
-            merged.append(df_pdf)
 
-        except Exception as err:
-            # 個別 PDF の失敗はログ化して続行
-            print(f"❌ ERROR processing {pdf_path.name}: {err.__class__.__name__}: {err}")
-            err_file = out_dir / f"{pdf_path.stem}_error.txt"
-            err_file.write_text(traceback.format_exc(), encoding="utf-8")
-            print(f"   ↳ 詳細は {err_file.relative_to(root)} に保存しました")
+@transformer
+def pdf_to_csv_fixed(*_, **kwargs) -> pd.DataFrame:
+    """Walk through every PDF under input/, extract all tables, save and merge."""
 
-    if not merged:
-        return pd.DataFrame()
+    root = Path(kwargs['root']).resolve() if kwargs.get('root') else Path.cwd()
+    in_dir = root / "input"
+    out_dir = root / "output"
+    out_dir.mkdir(exist_ok=True)
 
-    return pd.concat(merged, ignore_index=True, sort=False)
+    workers = int(kwargs['workers']) if kwargs.get('workers') else None
+    timeout = float(kwargs['timeout']) if kwargs.get('timeout') else None
+    page_batch = int(kwargs['page_batch']) if kwargs.get('page_batch') else None
+    formats = parse_formats(kwargs.get('output_format'))
+    prescan = _flag(kwargs, 'prescan', True)
+    merge = kwargs.get('merge') or 'frame'
+    if merge not in ('frame', 'file'):
+        raise ValueError(f"merge に指定できるのは frame / file です: {merge}")
+
+    pdf_paths = sorted(in_dir.glob("*.pdf"))
+    results: list[ExtractResult | None] = [None] * len(pdf_paths)
+    merger = TableMerger(len(pdf_paths), merged_path(out_dir, pdf_paths))
+
+    # ---- 前回から変わっていない PDF はキャッシュ（output/<stem>.csv）を使う ----
+    manifest = PdfManifest(out_dir, extract_params(prescan), fast=_flag(kwargs, 'fast_fingerprint'))
+    fingerprints = [manifest.fingerprint(p) for p in pdf_paths]
+    todo: list[int] = []
+    for i, (pdf_path, fp) in enumerate(zip(pdf_paths, fingerprints)):
+        entry = manifest.lookup(pdf_path, fp, skip_failed=_flag(kwargs, 'skip_failed'),
+                                force=_flag(kwargs, 'force'))
+        if entry is None:
+            todo.append(i)
+            continue
+        cached = ExtractResult(pdf_path.name, status=entry['status'], pages=entry.get('pages', 0))
+        if entry['status'] == 'ok':
+            cached.csv_path = manifest.csv_path(entry)
+            cached.messages.append(f"♻️  Unchanged, cached CSV used → {manifest.csv_path(entry).relative_to(root)}")
+        else:
+            cached.messages.append(f"⏭  Unchanged since last run ({entry['status']}) — skipped")
+        results[i] = cached
+        for line in cached.messages:
+            print(line)
+        _write_columnar(cached, formats, root, fresh=False)
+        merger.put(i, cached)
+    print(f"[CACHE] {len(pdf_paths) - len(todo)} cached / {len(todo)} to extract")
+
+    started = time.perf_counter()
+    todo_paths = [pdf_paths[i] for i in todo]
+    extracted_iter = iter_extract(todo_paths, root, out_dir, workers, timeout, page_batch, prescan)
+    for done, (j, result) in enumerate(extracted_iter, 1):
+        i = todo[j]
+        results[i] = result
+        manifest.record(pdf_paths[i], fingerprints[i], result.status, result.pages, result.csv_path)
+        print(f"[{done}/{len(todo)}] {result.name} ({result.pages} pages, {result.seconds:.1f}s)")
+        for line in result.messages:
+            print(line)
+        _write_columnar(result, formats, root, fresh=True)
+        merger.put(i, result)           # 入力順で揃った分を _merged.csv へ（DataFrame は手放す）
+    elapsed = time.perf_counter() - started
+    manifest.save()
+    merged_csv = merger.close()
+
+    # ---- 処理量のサマリ（実際に抽出したファイルのみ）----
+    extracted = [results[i] for i in todo]
+    pages = sum(r.pages for r in extracted if r)
+    failed = sum(1 for r in results if r and r.status in ('error', 'crashed'))
+    if todo and elapsed > 0:
+        print(f"⏱  {len(todo)} files / {pages} pages in {elapsed:.1f}s "
+              f"— {pages / elapsed:.2f} pages/s, {len(todo) / elapsed:.2f} files/s"
+              f" (errors: {failed})")
+
+    if merged_csv:
+        print(f"🧩 Merged {merger.total_rows} rows / {len(merger.columns)} columns → {merged_csv.relative_to(root)}")
+    if merge == 'file':
+        return pd.DataFrame(
+            [{'file': r.name, 'status': r.status, 'pages': r.pages, 'rows': merger.rows[i]}
+             for i, r in enumerate(results) if r],
+            columns=['file', 'status', 'pages', 'rows'])
+    return merger.to_frame()
 
 
 @test
 def test_output(output, **_):
     """Sanity check: output must be a DataFrame (can be empty)."""
     assert isinstance(output, pd.DataFrame), "Output is not DataFrame"
+    if list(output.columns) == ['file', 'status', 'pages', 'rows']:          # merge="file" のサマリ
+        unknown = set(output['status']) - {'ok', 'no_tables', 'blank', 'error', 'crashed'}
+        assert not unknown, f"未知の status: {unknown}"
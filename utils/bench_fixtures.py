@@ -0,0 +1,179 @@
+"""utils/bench_fixtures.py
+
+ベンチマーク用の入力データ生成（utils/benchmark.py から利用）。
+
+- make_rename_tsv : 種別の構成比を指定して rename.tsv 風の TSV を作る（既定は cp932）
+  * コミック / 成年コミック : [作者]タイトル 第N巻、英字作者（カナ変換経路）、[DL版] などのタグ
+  * 同人                    : (C105) などのイベント、日付、末尾の (シリーズ名)（登録済み / 未登録）
+  * 成年雑誌                : PATTERN_MAPPING にヒットする名称とヒットしない名称
+  * 美術 / 雑誌 / 小説 / その他 / CG
+- make_pdf_fixtures : 罫線付きの表を含む PDF を追加ライブラリなしで書き出す（pdf_to_csv 用）
+
+同じ seed なら毎回同じ内容になるので、エンジン変更の前後で同じ入力を使って比較できる。
+"""
+
+import csv
+import random
+from pathlib import Path
+from typing import Dict, List, Optional
+
+__all__ = ['DEFAULT_MIX', 'make_rename_tsv', 'make_pdf_fixtures']
+
+# 種別 → 構成比
+DEFAULT_MIX: Dict[str, float] = {
+    'コミック': 0.25,
+    '成年コミック': 0.12,
+    '電子成年コミック': 0.05,
+    '同人': 0.18,
+    '電子同人': 0.05,
+    '成年雑誌': 0.12,
+    '雑誌': 0.04,
+    '美術': 0.05,
+    '小説': 0.05,
+    'その他': 0.05,
+    'CG': 0.04,
+}
+
+_AUTHORS_JA = ['山田太郎', '鈴木花子', 'ほげ屋', '月見草', '高橋　一', '黒猫堂']
+_AUTHORS_EN = ['Tanaka Taro', 'mizuki', 'Kuro Neko', 'hoge-san', 'A_B']
+_TITLES = ['はじめての夏', '星降る夜に', 'Blue Sky', 'とある日常', '約束の場所', 'Re:start!', '猫と魔法使い',
+           'ひみつの放課後', 'Summer Days', '雨のち晴れ']
+_TAGS = ['', '', '', ' [DL版]', ' [Digital]', ' (オリジナル)', ' (PRESTIGE COMIC)']
+_EVENTS = ['(C105)', '(C104)', '(例大祭21)', '(サンクリ2024)', '(COMIC1☆25)', '']
+_SERIES_KNOWN = ['ブルーアーカイブ', '艦隊これくしょん -艦これ-', 'アズールレーン', 'グランブルーファンタジー']
+_SERIES_NEW = ['東方Project', 'ウマ娘 プリティーダービー', 'オリジナル作品', '原神']
+_MAGAZINE_HITS = [
+    'COMIC HOTMILK {y}-{m}', 'コミックアンリアル {y}年{m}月号 Vol.{v}', 'COMIC Kairakuten {y}-{m}',
+    'COMIC 快楽天ビースト {y}年{m}月号', 'COMIC BAVEL {y}年{m}月号', 'コミックメガストア Vol.{v}',
+    'COMIC ExE {v}', 'アナンガ・ランガ Vol.{v}',
+]
+_MAGAZINE_MISSES = ['月刊ほげマガジン {y}年{m}月号', 'COMIC 未登録 Vol.{v}', 'Weekly Something {y}-{m}']
+
+
+def _author(rng: random.Random) -> str:
+    return rng.choice(_AUTHORS_EN if rng.random() < 0.3 else _AUTHORS_JA)
+
+
+def _comic(rng: random.Random) -> str:
+    volume = f" 第{rng.randint(1, 30)}巻" if rng.random() < 0.7 else ''
+    return f"[{_author(rng)}] {rng.choice(_TITLES)}{volume}{rng.choice(_TAGS)}"
+
+
+def _doujin(rng: random.Random) -> str:
+    event = rng.choice(_EVENTS)
+    if not event and rng.random() < 0.5:
+        event = f"{rng.randint(2015, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    series = ''
+    if rng.random() < 0.8:
+        series = f" ({rng.choice(_SERIES_KNOWN if rng.random() < 0.6 else _SERIES_NEW)})"
+    return f"{event} [{_author(rng)}] {rng.choice(_TITLES)}{series}{rng.choice(_TAGS)}".strip()
+
+
+def _magazine(rng: random.Random, hit_ratio: float = 0.8) -> str:
+    pool = _MAGAZINE_HITS if rng.random() < hit_ratio else _MAGAZINE_MISSES
+    name = rng.choice(pool).format(y=rng.randint(2018, 2025), m=rng.randint(1, 12), v=rng.randint(1, 150))
+    return name + rng.choice(_TAGS)
+
+
+def _generic(rng: random.Random) -> str:
+    if rng.random() < 0.5:
+        return _comic(rng)
+    return f"{rng.choice(_TITLES)} {rng.choice(['設定資料集', 'ビジュアルブック', 'vol.2', ''])}".strip()
+
+
+_MAKERS = {
+    'コミック': _comic, 'CG': _comic,
+    '成年コミック': _comic, '電子成年コミック': _comic,
+    '同人': _doujin, '電子同人': _doujin,
+    '成年雑誌': _magazine,
+    '雑誌': lambda rng: '昭和40年男 ' + _comic(rng) if rng.random() < 0.5 else _generic(rng),
+}
+
+
+def make_rename_tsv(path: str, rows: int, mix: Optional[Dict[str, float]] = None,
+                    seed: int = 0, encoding: str = 'cp932') -> Dict[str, int]:
+    """rows 行の rename.tsv を書き出し、種別ごとの行数を返す。"""
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    kinds: List[str] = rng.choices(list(mix), weights=list(mix.values()), k=rows)
+    counts: Dict[str, int] = {}
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding=encoding, errors='replace', newline='') as f:
+        w = csv.writer(f, delimiter='\t', lineterminator='\n')
+        w.writerow(['種別', '名称'])
+        for kind in kinds:
+            w.writerow([kind, _MAKERS.get(kind, _generic)(rng)])
+            counts[kind] = counts.get(kind, 0) + 1
+    return counts
+
+
+# --- PDF -------------------------------------------------------------------
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _table_stream(rows: int, cols: int, page: int, x0: float = 50, y0: float = 780,
+                  cell_w: float = 90, cell_h: float = 18) -> bytes:
+    """罫線（lattice で検出される）とセル文字列を描く content stream。"""
+    width, height = cols * cell_w, rows * cell_h
+    ops = ['0.8 w']
+    for r in range(rows + 1):
+        y = y0 - r * cell_h
+        ops.append(f"{x0} {y} m {x0 + width} {y} l S")
+    for c in range(cols + 1):
+        x = x0 + c * cell_w
+        ops.append(f"{x} {y0} m {x} {y0 - height} l S")
+    ops.append('BT /F1 9 Tf')
+    for r in range(rows):
+        for c in range(cols):
+            text = f"h{c}" if r == 0 else f"p{page}r{r}c{c}"
+            ops.append(f"1 0 0 1 {x0 + c * cell_w + 4} {y0 - (r + 1) * cell_h + 5} Tm ({_pdf_escape(text)}) Tj")
+    ops.append('ET')
+    return '\n'.join(ops).encode('ascii')
+
+
+def _text_stream(page: int) -> bytes:
+    return f"BT /F1 11 Tf 50 780 Td (Text only page {page}.) Tj ET".encode('ascii')
+
+
+def _write_pdf(path: Path, streams: List[bytes]) -> None:
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",                                                            # Pages（後で埋める）
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for stream in streams:
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode('ascii'))
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode('ascii')
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode('ascii') + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('ascii')
+    out += b''.join(f"{o:010d} 00000 n \n".encode('ascii') for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('ascii')
+    path.write_bytes(bytes(out))
+
+
+def make_pdf_fixtures(in_dir: str, files: int = 4, pages: int = 10, rows: int = 20,
+                      cols: int = 4, table_every: int = 1) -> List[Path]:
+    """in_dir に bench_XX.pdf を files 個作る。table_every ページごとに表を 1 つ置く。"""
+    in_dir = Path(in_dir)
+    in_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(files):
+        streams = [_table_stream(rows + 1, cols, p) if p % table_every == 0 else _text_stream(p)
+                   for p in range(pages)]
+        path = in_dir / f"bench_{i:02d}.pdf"
+        _write_pdf(path, streams)
+        paths.append(path)
+    return paths
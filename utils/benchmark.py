@@ -0,0 +1,268 @@
+"""utils/benchmark.py
+
+変換処理のスループット計測。リポジトリ直下で実行する:
+
+    python -m utils.benchmark --rows 100000 --out bench/after.json
+    python -m utils.benchmark --rows 100000 --kwargs '{"vectorized": true}' --compare bench/before.json
+    python -m utils.benchmark --pdf-files 4 --pdf-pages 20 --skip-titles
+    python -m utils.benchmark --pdf-files 4 --pdf-pages 24 --pdf-table-every 4 --skip-titles
+
+計測項目（stage ごと）:
+- normalize_titles  : ブロック全体（読み込み〜TSV 書き出し）の rows/sec
+- convert_one       : 1 行ずつの変換レイテンシ（種別ごとの p50 / p90 / p99, µs）
+- format_title      : 同上
+- parse_comic_name  : 同上（種別は問わず全行）
+- pdf_to_csv_fixed  : ブロック全体の pages/sec, files/sec
+
+各 stage は別プロセスで実行するので、peak_rss_mb はその stage だけの最大 RSS。
+結果は JSON に保存し、--compare で以前の結果と rows/sec を比べられる。
+入力は utils.bench_fixtures で seed 固定で生成する。
+"""
+
+import argparse
+import json
+import os
+import platform
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.bench_fixtures import make_pdf_fixtures, make_rename_tsv
+
+try:
+    import resource              # Unix のみ
+except ImportError:              # pragma: no cover
+    resource = None
+
+__all__ = ['run_benchmarks', 'compare']
+
+ROOT = Path(__file__).resolve().parent.parent
+PERCENTILES = (50, 90, 99)
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _load_block(relpath: str) -> dict:
+    """Mage のデコレーターを素通しにしてブロックを読み込む。"""
+    identity = lambda f: f
+    return runpy.run_path(str(ROOT / relpath), init_globals={'transformer': identity, 'test': identity})
+
+
+def _latency_stats(samples_ns: List[int]) -> dict:
+    arr = np.asarray(samples_ns, dtype=np.float64) / 1000.0
+    stats = {f"p{p}_us": round(float(np.percentile(arr, p)), 2) for p in PERCENTILES}
+    stats.update(count=len(arr), mean_us=round(float(arr.mean()), 2))
+    return stats
+
+
+def _read_pairs(tsv_path: str):
+    df = pd.read_csv(tsv_path, sep='\t', encoding='cp932')
+    kinds = df['種別'].astype(object).map(str).str.strip().tolist()
+    names = df['名称'].astype(object).map(str).str.strip().tolist()
+    return kinds, names
+
+
+def _per_kind(func, kinds: List[str], names: List[str], by_kind: bool = True) -> dict:
+    samples: Dict[str, List[int]] = {}
+    clock = time.perf_counter_ns
+    started = time.perf_counter()
+    for kind, name in zip(kinds, names):
+        t0 = clock()
+        func(kind, name)
+        samples.setdefault(kind if by_kind else '*', []).append(clock() - t0)
+    elapsed = time.perf_counter() - started
+    return {
+        'rows': len(kinds),
+        'seconds': round(elapsed, 4),
+        'rows_per_sec': round(len(kinds) / elapsed, 1) if elapsed else None,
+        'latency': {k: _latency_stats(v) for k, v in sorted(samples.items())},
+    }
+
+
+# --- stage（子プロセスで実行）---------------------------------------------
+
+def _stage_normalize_titles(tsv_path: str, work_dir: str, kwargs: dict) -> dict:
+    block = _load_block('transformers/book_title_transformer.py')
+    data = {'input_path': tsv_path, 'output_path': os.path.join(work_dir, 'out', 'rename_out.tsv')}
+    started = time.perf_counter()
+    out = block['normalize_titles'](data, **kwargs)[0]      # stats=True なら返り値は 3 つ
+    elapsed = time.perf_counter() - started
+    rows = int(out['件数'].sum()) if '件数' in out.columns else len(out)
+    return {'rows': rows, 'seconds': round(elapsed, 4), 'rows_per_sec': round(rows / elapsed, 1)}
+
+
+def _stage_convert_one(tsv_path: str, work_dir: str, kwargs: dict) -> dict:
+    from utils import rule_engine
+    from utils.title_normalizer import convert_one
+    rules = rule_engine.current()
+    kinds, names = _read_pairs(tsv_path)
+    return _per_kind(lambda k, n: convert_one(k, n, rules), kinds, names)
+
+
+def _stage_format_title(tsv_path: str, work_dir: str, kwargs: dict) -> dict:
+    from utils.title_formatter import format_title
+    kinds, names = _read_pairs(tsv_path)
+    return _per_kind(format_title, kinds, names)
+
+
+def _stage_parse_comic_name(tsv_path: str, work_dir: str, kwargs: dict) -> dict:
+    from utils.comic_parser import parse_comic_name
+    kinds, names = _read_pairs(tsv_path)
+    return _per_kind(lambda k, n: parse_comic_name(n), kinds, names, by_kind=False)
+
+
+def _stage_pdf_to_csv(pdf_root: str, work_dir: str, kwargs: dict) -> dict:
+    block = _load_block('transformers/pdf_to_csv.py')
+    os.chdir(pdf_root)                  # ブロックは cwd の input/ → output/ を処理する
+    started = time.perf_counter()
+    df = block['pdf_to_csv_fixed'](**{'force': True, **kwargs})
+    elapsed = time.perf_counter() - started
+    manifest = json.loads((Path(pdf_root) / 'output' / '.pdf_manifest.json').read_text(encoding='utf-8'))
+    files = manifest['files']
+    pages = sum(int(e.get('pages', 0)) for e in files.values())
+    return {
+        'files': len(files), 'pages': pages, 'rows': len(df), 'seconds': round(elapsed, 4),
+        'pages_per_sec': round(pages / elapsed, 2), 'files_per_sec': round(len(files) / elapsed, 2),
+    }
+
+
+_STAGES = {
+    'normalize_titles': _stage_normalize_titles,
+    'convert_one': _stage_convert_one,
+    'format_title': _stage_format_title,
+    'parse_comic_name': _stage_parse_comic_name,
+    'pdf_to_csv_fixed': _stage_pdf_to_csv,
+}
+
+
+def _run_stage(name: str, source: str, work_dir: str, kwargs: dict) -> dict:
+    result = _STAGES[name](source, work_dir, kwargs)
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def _isolated(name: str, source: str, work_dir: str, kwargs: dict) -> dict:
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(_run_stage, name, source, work_dir, kwargs).result()
+
+
+# --- 実行・比較 -------------------------------------------------------------
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_benchmarks(rows: int = 50_000, seed: int = 0, kwargs: Optional[dict] = None,
+                   titles: bool = True, pdf_files: int = 0, pdf_pages: int = 10,
+                   pdf_kwargs: Optional[dict] = None, work_dir: Optional[str] = None,
+                   pdf_table_every: int = 1) -> dict:
+    """入力を生成して各 stage を計測し、JSON に保存できる dict を返す。"""
+    kwargs, pdf_kwargs = kwargs or {}, pdf_kwargs or {}
+    work_dir = work_dir or tempfile.mkdtemp(prefix='bench_')
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git': _git_revision(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'rows': rows, 'seed': seed, 'kwargs': kwargs,
+        },
+        'stages': {},
+    }
+
+    if titles:
+        tsv_path = os.path.join(work_dir, 'rename.tsv')
+        report['meta']['kinds'] = make_rename_tsv(tsv_path, rows, seed=seed)
+        for name in ('normalize_titles', 'convert_one', 'format_title', 'parse_comic_name'):
+            print(f"[BENCH] {name} …", flush=True)
+            report['stages'][name] = _isolated(name, tsv_path, work_dir, kwargs)
+
+    if pdf_files:
+        pdf_root = os.path.join(work_dir, 'pdf')
+        make_pdf_fixtures(os.path.join(pdf_root, 'input'), files=pdf_files, pages=pdf_pages,
+                          table_every=pdf_table_every)
+        (Path(pdf_root) / 'output').mkdir(parents=True, exist_ok=True)
+        report['meta'].update(pdf_files=pdf_files, pdf_pages=pdf_pages, pdf_table_every=pdf_table_every,
+                              pdf_kwargs=pdf_kwargs)
+        print("[BENCH] pdf_to_csv_fixed …", flush=True)
+        report['stages']['pdf_to_csv_fixed'] = _isolated('pdf_to_csv_fixed', pdf_root, work_dir, pdf_kwargs)
+    return report
+
+
+def compare(before: dict, after: dict) -> pd.DataFrame:
+    """2 つの結果の throughput と peak RSS を stage ごとに並べる（ratio > 1 なら速くなった）。"""
+    rows = []
+    for stage, new in after['stages'].items():
+        old = before.get('stages', {}).get(stage)
+        if not old:
+            continue
+        metric = 'pages_per_sec' if 'pages_per_sec' in new else 'rows_per_sec'
+        ratio = new[metric] / old[metric] if old.get(metric) else None
+        rows.append({'stage': stage, 'metric': metric, 'before': old.get(metric), 'after': new[metric],
+                     'ratio': round(ratio, 2) if ratio else None,
+                     'rss_before_mb': old.get('peak_rss_mb'), 'rss_after_mb': new.get('peak_rss_mb')})
+    return pd.DataFrame(rows)
+
+
+def _summary(report: dict) -> pd.DataFrame:
+    rows = []
+    for stage, r in report['stages'].items():
+        rate = r.get('rows_per_sec') if 'rows_per_sec' in r else r.get('pages_per_sec')
+        unit = 'rows/s' if 'rows_per_sec' in r else 'pages/s'
+        rows.append({'stage': stage, 'throughput': rate, 'unit': unit,
+                     'seconds': r['seconds'], 'peak_rss_mb': r.get('peak_rss_mb')})
+    return pd.DataFrame(rows)
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog='python -m utils.benchmark', description=__doc__.split('\n\n')[0])
+    ap.add_argument('--rows', type=int, default=50_000)
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--kwargs', default='{}', help='normalize_titles に渡す kwargs（JSON）')
+    ap.add_argument('--skip-titles', action='store_true', help='タイトル変換系の stage を計測しない')
+    ap.add_argument('--pdf-files', type=int, default=0, help='0 なら pdf_to_csv_fixed を計測しない')
+    ap.add_argument('--pdf-pages', type=int, default=10)
+    ap.add_argument('--pdf-table-every', type=int, default=1,
+                    help='N ページごとに表を置く（残りはテキストだけのページ）')
+    ap.add_argument('--pdf-kwargs', default='{}', help='pdf_to_csv_fixed に渡す kwargs（JSON）')
+    ap.add_argument('--work-dir', help='生成した入力・出力の置き場（既定は一時ディレクトリ）')
+    ap.add_argument('--out', help='結果 JSON の保存先')
+    ap.add_argument('--compare', help='比較対象の結果 JSON')
+    args = ap.parse_args(argv)
+
+    report = run_benchmarks(rows=args.rows, seed=args.seed, kwargs=json.loads(args.kwargs),
+                            titles=not args.skip_titles, pdf_files=args.pdf_files,
+                            pdf_pages=args.pdf_pages, pdf_kwargs=json.loads(args.pdf_kwargs),
+                            work_dir=args.work_dir, pdf_table_every=args.pdf_table_every)
+    print(_summary(report).to_string(index=False))
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding='utf-8')
+        print(f"[BENCH] saved → {args.out}")
+    if args.compare:
+        before = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        print(compare(before, report).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
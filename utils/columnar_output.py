@@ -0,0 +1,138 @@
+"""utils/columnar_output.py
+
+TSV / CSV と並べて書き出す列指向の出力（output_format kwarg 用、pyarrow が必要）。
+
+- parquet : `<stem>.parquet`（種別 などは辞書エンコード）
+- arrow   : `<stem>.arrow`（Arrow IPC ファイル、非圧縮なので pa.memory_map でそのまま読める）
+
+列はすべて文字列（欠損は null）で保存する。チャンクごとに型推論が揺れても
+スキーマが変わらないようにするため。Shift_JIS の TSV と違い、文字は落とさない。
+辞書エンコードする列は、チャンクをまたいで辞書を追記していく（IPC ファイルは
+辞書の置き換えを許さないため）。
+
+pyarrow は実際に書き出すときに初めて import する。
+ColumnarWriter は `<stem>.parquet.tmp` などへ書き、close() で本来の名前に置き換える。
+with ブロックが例外で抜けたときは一時ファイルを消すので、途中までのファイルは残らない
+（前回の出力もそのまま）。
+"""
+
+import importlib.util
+import os
+from typing import Dict, Iterable, List, Sequence
+
+import pandas as pd
+
+__all__ = ['FORMATS', 'parse_formats', 'ColumnarWriter', 'write_columnar']
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+_LEGACY = {'tsv', 'csv', ''}
+
+
+def parse_formats(value) -> List[str]:
+    """'parquet' / 'arrow' / 'parquet,arrow' / ['parquet', ...] → 追加で書く形式のリスト。
+
+    tsv / csv（従来の出力）は常に書くので、指定されていても無視する。
+    """
+    if not value:
+        return []
+    items = value.split(',') if isinstance(value, str) else list(value)
+    formats = []
+    for item in (str(i).strip().lower() for i in items):
+        if item in _LEGACY:
+            continue
+        if item not in FORMATS:
+            raise ValueError(f"output_format に指定できるのは tsv / {' / '.join(FORMATS)} です: {item}")
+        if item not in formats:
+            formats.append(item)
+    if formats and importlib.util.find_spec('pyarrow') is None:
+        raise ImportError('output_format=parquet / arrow には pyarrow が必要です（pip install pyarrow）')
+    return formats
+
+
+def _as_strings(values: pd.Series) -> list:
+    return [None if pd.isna(v) else str(v) for v in values]
+
+
+class ColumnarWriter:
+    """DataFrame をチャンク単位で parquet / arrow ファイルへ追記する。"""
+
+    def __init__(self, base_path: str, formats: Sequence[str],
+                 dictionary_columns: Iterable[str] = ('種別',)):
+        stem, _ = os.path.splitext(base_path)
+        self.paths: Dict[str, str] = {fmt: stem + FORMATS[fmt] for fmt in formats}
+        self.dictionary_columns = set(dictionary_columns)
+        self._dicts: Dict[str, Dict[str, int]] = {}
+        self._schema = None
+        self._writers: Dict[str, object] = {}
+
+    def _table(self, df: pd.DataFrame):
+        import pyarrow as pa
+        arrays, names = [], []
+        for col in df.columns:
+            values = _as_strings(df[col])
+            if col in self.dictionary_columns:
+                # これまでの辞書の後ろに新しい値だけを足す（既存のインデックスは変えない）
+                seen = self._dicts.setdefault(col, {})
+                indices = [None if v is None else seen.setdefault(v, len(seen)) for v in values]
+                arrays.append(pa.DictionaryArray.from_arrays(
+                    pa.array(indices, type=pa.int32()), pa.array(list(seen), type=pa.string())))
+            else:
+                arrays.append(pa.array(values, type=pa.string()))
+            names.append(str(col))
+        return pa.Table.from_arrays(arrays, names=names)
+
+    def _open(self, schema) -> None:
+        import pyarrow.ipc as pa_ipc
+        import pyarrow.parquet as pq
+        for fmt, path in self.paths.items():
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            if fmt == 'parquet':
+                self._writers[fmt] = pq.ParquetWriter(path + '.tmp', schema)
+            else:
+                options = pa_ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+                self._writers[fmt] = pa_ipc.new_file(path + '.tmp', schema, options=options)
+
+    def write(self, df: pd.DataFrame) -> None:
+        if not self.paths:
+            return
+        table = self._table(df)
+        if self._schema is None:
+            self._schema = table.schema
+            self._open(self._schema)
+        elif table.schema != self._schema:
+            table = table.select(self._schema.names).cast(self._schema)
+        for writer in self._writers.values():
+            writer.write_table(table)
+
+    def close(self) -> None:
+        """書き終えたファイルを本来の名前にする。"""
+        for fmt, writer in self._writers.items():
+            writer.close()
+            os.replace(self.paths[fmt] + '.tmp', self.paths[fmt])
+        self._writers.clear()
+
+    def abort(self) -> None:
+        """書きかけの一時ファイルを消す。"""
+        for fmt, writer in self._writers.items():
+            writer.close()
+            os.remove(self.paths[fmt] + '.tmp')
+        self._writers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_columnar(df: pd.DataFrame, base_path: str, formats: Sequence[str],
+                   dictionary_columns: Iterable[str] = ('種別',)) -> Dict[str, str]:
+    """df を 1 回で書き出し、{形式: パス} を返す。"""
+    if not formats:
+        return {}
+    with ColumnarWriter(base_path, formats, dictionary_columns) as writer:
+        writer.write(df)
+    return writer.paths
@@ -5,10 +5,18 @@ utils/comic_parser.py – 2025-06-13 EXTENDED
 * 半角記号 → 全角記号
 * アルファベット → カタカナ（jaconv が入っていれば自動）
 * 作者名中の空白も削除
+* parse_comic_names / clean_series / clean_author_series : 列（Series）単位の一括版
+  （同じ名称は 1 回だけ処理。ASCII 作者名のカナ変換は件数上限付きでキャッシュ）
+* tokenize : 名称を 1 回走査して [..] / (..) / タグ / 日付 / 巻数 を切り出し、TitleTokens にまとめる
+  （parse_comic_name も各種別の変換もこれを読む。結果は従来の正規表現と同じ）
 """
 
 import re
-from typing import Dict, Optional
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
 
 try:
     import jaconv             # optional
@@ -18,6 +26,12 @@ except ImportError:
 
 _ASCII_ONLY = re.compile(r'^[A-Za-z0-9 _\-]+$')
 
+KANA_CACHE_SIZE = 65_536    # 小文字化→カナ変換のキャッシュ件数（作者名は繰り返し出てくる）
+
+@lru_cache(maxsize=KANA_CACHE_SIZE)
+def _ascii_kana(s: str) -> str:
+    return to_kana(s.lower())
+
 _FULLWIDTH = str.maketrans({
     '!': '！', '#': '＃', '$': '＄', '%': '％', '&': '＆',
     '+': '＋', ',': '，', '-': '－', ':': '：', ';': '；', '?': '？',
@@ -44,17 +58,19 @@ def _maybe_kana(s: str) -> str:
 def _clean_author(author: str) -> str:
     author = author.replace(" ", "")
     if _ascii_only(author):
-        author = author.lower()
-        author = to_kana(author)
+        author = _ascii_kana(author)
     return author.translate(_FULLWIDTH).strip()
 
 def _clean(text: Optional[str]) -> str:
     if not text:
         return ""
-    text = _TAG_RE.sub("", text).strip()
+    return _clean_untagged(_TAG_RE.sub("", text))
+
+def _clean_untagged(text: str) -> str:
+    """_clean のタグ除去より後ろ（タグを含まないと分かっている文字列用）。"""
+    text = text.strip()
     if _ascii_only(text):
-        text = text.lower()
-        text = to_kana(text)
+        text = _ascii_kana(text)
     return text.translate(_FULLWIDTH).strip()
 
 _AUTHOR_BLOCK_RE = re.compile(r"\[([^\]]+)\]")        # すべての […]
@@ -69,19 +85,157 @@ def _extract_author_block(text: str) -> str:
     return blocks[-1] if blocks else ""
 
 def parse_comic_name(name: str) -> Dict[str, Optional[str]]:
-   # --- 作者ブロックを自前で抽出 ---------------------
-    author_raw = _extract_author_block(name)
+    t = tokenize(name)
+    return {"author": t.author, "title": t.title, "volume": t.volume}
 
-    # --- タイトル & 巻数は従来の正規表現で ---------- 
+
+def _parse_comic_name_re(name: str) -> Tuple[str, str, Optional[str]]:
+    """従来の正規表現版 (author, title, volume)。改行を含む名称だけこちらを使う。"""
+    author_raw = _extract_author_block(name)
     m = _COMIC_RE.search(name)
     title_raw  = m.group("title")  if m else name
     volume_raw = m.group("volume") if m else None
+    return _clean_author(author_raw), _clean(title_raw), volume_raw
+
+
+# --- 1 回走査のトークナイザー ------------------------------------------------
+# [..] / (..) の位置は str.find で区切り文字から区切り文字へ飛んで拾う（名称の長さに線形）。
+# 同人用のイベント・日付・シリーズもここで切り出すので、変換側で正規表現を組み立て直さない。
+# 改行を含む名称は `.` の扱いが変わるので、従来の正規表現に任せる。
+
+_EVENT_KW_RE = re.compile(r"サンクリ|例大祭|COMIC|C\d+", re.IGNORECASE)   # (..) 内のイベント名
+_EVENT_RE  = re.compile(r"\(([^)]*(サンクリ|例大祭|COMIC|C\d+)[^)]*)\)", re.IGNORECASE)
+_DATE_RE   = re.compile(r"(\d{4}-\d{2}-\d{2})")
+_SERIES_RE = re.compile(r"\(([^()]+)\)(?!.*\([^()]*\))")
+
 
-    return {
-        "author": _clean_author(author_raw),
-        "title":  _clean(title_raw),
-        "volume": volume_raw,
-    }
+@dataclass(frozen=True)
+class TitleTokens:
+    name: str                  # 元の名称
+    clean: str                 # タグ（[DL版] 等）を除いて前後の空白を落としたもの
+    author: str                # 最後の [..]（clean 上）を整えたもの
+    title: str                 # 最初の [..] の後ろ（第N巻 を除く）を整えたもの。[..] が無ければ名称全体
+    volume: Optional[str]      # 第N巻 の N
+    event: Optional[str]       # イベント名を含む最初の (..) の中身（元の名称上）
+    date: Optional[str]        # clean 中の最初の yyyy-mm-dd を yyyymmdd にしたもの
+    series: str                # clean の最後の (..) の中身（strip 済み、無ければ空文字）
+
+
+def _brackets(s: str) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
+    """中身が空でない [..] の最初と最後の位置 (開き, 閉じ)（_AUTHOR_BLOCK_RE.findall と同じ区切り方）。"""
+    first = last = None
+    pos = 0
+    while True:
+        p = s.find('[', pos)
+        if p < 0:
+            break
+        q = s.find(']', p + 1)
+        if q < 0:
+            break
+        if q == p + 1:                  # [] は一致しない
+            pos = p + 1
+            continue
+        last = (p, q)
+        if first is None:
+            first = last
+        pos = q + 1
+    return first, last
+
+
+def _title_volume(s: str, first: Optional[Tuple[int, int]]) -> Tuple[str, Optional[str]]:
+    """_COMIC_RE の title / volume（[..] が無ければ名称全体と None）。"""
+    if first is None:
+        return s, None
+    body = s[first[1] + 1:].strip()
+    if body.endswith('巻'):
+        end = len(body) - 1
+        k = end
+        while k > 0 and body[k - 1].isdecimal():
+            k -= 1
+        if k < end and k > 0 and body[k - 1] == '第':
+            return body[:k - 1].rstrip(), body[k:end]
+    return body, None
+
+
+def _event(s: str) -> Optional[str]:
+    """_EVENT_RE の group(1)。( から次の ) までにイベント名を含む最初のもの。"""
+    p = s.find('(')
+    while p >= 0:
+        q = s.find(')', p + 1)
+        if q < 0:
+            return None
+        if _EVENT_KW_RE.search(s, p + 1, q):
+            return s[p + 1:q]
+        p = s.find('(', q + 1)          # 間の ( から始めても中身は今の部分列なので飛ばせる
+    return None
+
+
+def _date(s: str) -> Optional[str]:
+    """_DATE_RE の最初の一致から - を除いたもの。"""
+    h = s.find('-', 4)
+    while h >= 0:
+        d = s[h - 4:h + 6]
+        if (len(d) == 10 and d[9].isdecimal() and d[7] == '-' and d[:4].isdecimal()
+                and d[5:7].isdecimal() and d[8:10].isdecimal()):
+            return d[:4] + d[5:7] + d[8:10]
+        h = s.find('-', h + 1)
+    return None
+
+
+def _series(s: str) -> str:
+    """_SERIES_RE の group(1).strip()。最後の (..)（中に括弧を含まない）の中身。"""
+    q = s.rfind(')')
+    if q < 0:
+        return ""
+    p = s.rfind('(', 0, q)
+    if p < 0:
+        return ""
+    q = s.find(')', p + 1)
+    return s[p + 1:q].strip()
+
+
+def _tokenize_re(name: str, clean: str) -> TitleTokens:
+    author, title, volume = _parse_comic_name_re(name)
+    m_evt = _EVENT_RE.search(name)
+    d = _DATE_RE.search(clean)
+    m_ser = _SERIES_RE.search(clean)
+    return TitleTokens(name, clean, author, title, volume,
+                       m_evt.group(1) if m_evt else None,
+                       d.group(0).replace('-', '') if d else None,
+                       m_ser.group(1).strip() if m_ser else "")
+
+
+def tokenize(name: str) -> TitleTokens:
+    """名称を 1 回走査して TitleTokens にする。
+
+    author / title / volume は従来の parse_comic_name(name)、event は _EVENT_RE を名称に、
+    date / series は _DATE_RE / _SERIES_RE をタグ除去後の名称に当てた結果と同じ。
+    """
+    clean, n_tags = _TAG_RE.subn("", name)
+    clean = clean.strip()
+    if '\n' in name:
+        return _tokenize_re(name, clean)
+
+    first, last = _brackets(clean)
+    if n_tags:
+        # タイトルは（タグを残した）元の名称の最初の [..] から取り、タグは整えるときに除く
+        first = _brackets(name)[0]
+        title_raw, volume = _title_volume(name, first)
+        title = _clean(title_raw)
+    else:
+        title_raw, volume = _title_volume(clean if first else name, first)
+        title = _clean_untagged(title_raw) if title_raw else ""
+    author = _clean_author(clean[last[0] + 1:last[1]]) if last else ""
+
+    return TitleTokens(name, clean, author, title, volume,
+                       _event(name) if '(' in name else None,
+                       _date(clean) if '-' in clean else None,
+                       _series(clean))
+
+
+def tokenize_clean(tokens: TitleTokens) -> TitleTokens:
+    """tokens.clean をもう一度 tokenize したもの（同人の作者・タイトルは clean から取る）。"""
+    return tokens if tokens.clean == tokens.name else tokenize(tokens.clean)
 
 
 def format_comic(info: Dict[str, Optional[str]]) -> str:
@@ -93,3 +247,46 @@ def format_comic(info: Dict[str, Optional[str]]) -> str:
     if info.get("volume"):
         parts.append(f" 第{info['volume']}巻")
     return "".join(parts)
+
+
+# --- 列（Series）単位の一括処理 ---------------------------------------------
+# 重複を除いた値ごとに 1 件版を 1 回だけ呼ぶので、結果は 1 件ずつ処理した場合と同じ。
+# （Series.str で列全体を流すより、重複除去 + 1 件版のほうが速かった）
+
+def _map_unique(values: pd.Series, fn) -> pd.Series:
+    memo: Dict[str, object] = {}
+    out = []
+    for v in values:
+        r = memo.get(v, memo)
+        if r is memo:
+            r = memo[v] = fn(v)
+        out.append(r)
+    return pd.Series(out, index=values.index, dtype=object)
+
+
+def clean_series(texts: pd.Series) -> pd.Series:
+    """_clean の列版（タグ除去 → ASCII 判定・カナ変換 → 全角化）。"""
+    return _map_unique(texts, _clean)
+
+
+def clean_author_series(authors: pd.Series) -> pd.Series:
+    """_clean_author の列版。"""
+    return _map_unique(authors, _clean_author)
+
+
+def tokenize_names(names) -> List[TitleTokens]:
+    """tokenize の列版（同じ名称は 1 回だけ処理）。"""
+    memo: Dict[str, TitleTokens] = {}
+    out = []
+    for name in names:
+        t = memo.get(name)
+        if t is None:
+            t = memo[name] = tokenize(name)
+        out.append(t)
+    return out
+
+
+def parse_comic_names(names: pd.Series) -> pd.DataFrame:
+    """parse_comic_name の列版。author / title / volume 列を names と同じ index で返す。"""
+    rows = [(t.author, t.title, t.volume) for t in tokenize_names(names)]
+    return pd.DataFrame(rows, index=names.index, columns=["author", "title", "volume"], dtype=object)
@@ -0,0 +1,69 @@
+"""utils/compact_frame.py
+
+タイトル DataFrame の省メモリ表現（normalize_titles の compact=True 用）。
+
+- 種別       : category（種類は十数個なので 1 行あたり整数コード 1 バイト）
+- 名称 / 変換後 : Arrow 実装の文字列（1 セルごとの Python str を持たない）。変換後は SLICE_ROWS 行ずつ
+               変換して詰めるので、変換途中の object 列も 1 スライス分で済む
+- 出力日時   : 値 1 個の category（全行同じ文字列を並べない。incremental で前回の日時が
+               混ざっても値の種類ぶんだけ）
+
+どれも to_csv / ColumnarWriter で書き出すときに文字列へ展開されるので、出力ファイルは従来と同じ。
+pyarrow が無ければ文字列列はそのまま（category 化だけ行う）。
+"""
+
+import importlib.util
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['SLICE_ROWS', 'string_dtype', 'compact_strings', 'constant_column', 'compact_frame', 'concat_strings']
+
+CATEGORY_COLUMNS = ('種別',)
+STRING_COLUMNS = ('名称',)
+SLICE_ROWS = 100_000       # 変換結果（object の str）を一度に持つ行数。変換し終えたスライスから Arrow に詰める
+
+
+def string_dtype():
+    """Arrow 実装の文字列 dtype（欠損は NaN のまま）。pyarrow が無ければ None。"""
+    if importlib.util.find_spec('pyarrow') is None:
+        return None
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)
+    except TypeError:               # na_value を取らない pandas
+        return pd.StringDtype('pyarrow')
+
+
+def compact_strings(values: pd.Series) -> pd.Series:
+    dtype = string_dtype()
+    if dtype is None or values.dtype == dtype:
+        return values
+    return values.astype(dtype)
+
+
+def constant_column(value: str, index: pd.Index) -> pd.Series:
+    """全行が value の列を、値 1 個の category として作る。"""
+    codes = np.zeros(len(index), dtype=np.int8)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=[value]), index=index)
+
+
+def compact_frame(df: pd.DataFrame, category_columns: Iterable[str] = CATEGORY_COLUMNS,
+                  string_columns: Iterable[str] = STRING_COLUMNS) -> pd.DataFrame:
+    """df の列をその場で省メモリの dtype に置き換えて返す。"""
+    for col in category_columns:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col in string_columns:
+        if col in df.columns:
+            df[col] = compact_strings(df[col])
+    return df
+
+
+def concat_strings(parts: List[pd.Series], index: pd.Index) -> pd.Series:
+    """スライスごとの文字列列をつなぐ（Arrow 実装ならチャンクを束ねるだけでコピーしない）。"""
+    if not parts:
+        return compact_strings(pd.Series([], index=index, dtype=object))
+    out = parts[0] if len(parts) == 1 else pd.concat(parts)
+    out.index = index
+    return out
@@ -0,0 +1,135 @@
+"""utils/conversion_stats.py
+
+タイトル変換の計測（stats=True のときだけ有効。渡さなければ計測コードは一切通らない）。
+
+- 種別ごと : 行数 / 累計時間 / 正規表現の評価回数（PATTERN_MAPPING + CLIP_REGEX）
+            / マッピング成立・CLIP_REGEX へのフォールスルー・DEFAULT_FILL へのフォールスルー
+- ルールごと: 評価回数（キーワードで候補に残った回数）/ ヒット回数
+- シリーズ  : SERIES_MAPPING に完全一致せず、正規化キー / あいまい一致で見つかったもの（確信度つき）
+
+to_frame() は PATTERN_MAPPING の全ルールを 0 件のものも含めて並べるので、
+一度も評価されない・一度もヒットしないルールが分かる。
+ワーカープロセスで集計したものは merge() で親にまとめる。
+"""
+
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+__all__ = ['ConversionStats']
+
+# 種別ごとのカウンタの並び
+_ROWS, _NS, _EVALS, _MAPPED, _CLIP, _DEFAULT = range(6)
+
+
+class ConversionStats:
+    """種別・ルール単位のカウンタ。"""
+
+    def __init__(self):
+        self.kinds: Dict[str, List[int]] = {}
+        self.rules: Dict[Tuple[str, int], List[int]] = {}     # (種別, ルール番号) → [評価, ヒット]
+        self.series_hits: Dict[Tuple[str, str], list] = {}    # (種別, シリーズ名) → [件数, SeriesMatch]
+
+    def _kind(self, kind: str) -> List[int]:
+        counters = self.kinds.get(kind)
+        if counters is None:
+            counters = self.kinds[kind] = [0] * 6
+        return counters
+
+    # --- 記録 ---
+
+    def timed(self, kind: str, ns: int, rows: int = 1) -> None:
+        counters = self._kind(kind)
+        counters[_ROWS] += rows
+        counters[_NS] += ns
+
+    def rule(self, kind: str, idx: int, hit: bool) -> None:
+        counters = self.rules.get((kind, idx))
+        if counters is None:
+            counters = self.rules[(kind, idx)] = [0, 0]
+        counters[0] += 1
+        counters[1] += hit
+        self._kind(kind)[_EVALS] += 1
+
+    def clip_eval(self, kind: str) -> None:
+        self._kind(kind)[_EVALS] += 1
+
+    def outcome(self, kind: str, outcome: str, n: int = 1) -> None:
+        """outcome: 'mapping' / 'clip' / 'default'（種別固有の分岐で変換した行は記録しない）。"""
+        slot = {'mapping': _MAPPED, 'clip': _CLIP, 'default': _DEFAULT}[outcome]
+        self._kind(kind)[slot] += n
+
+    def series(self, kind: str, series_raw: str, match) -> None:
+        entry = self.series_hits.get((kind, series_raw))
+        if entry is None:
+            entry = self.series_hits[(kind, series_raw)] = [0, match]
+        entry[0] += 1
+
+    def merge(self, other: 'ConversionStats') -> None:
+        for kind, counters in other.kinds.items():
+            mine = self._kind(kind)
+            for i, v in enumerate(counters):
+                mine[i] += v
+        for key, (attempts, hits) in other.rules.items():
+            mine = self.rules.setdefault(key, [0, 0])
+            mine[0] += attempts
+            mine[1] += hits
+        for key, (count, match) in other.series_hits.items():
+            mine = self.series_hits.setdefault(key, [0, match])
+            mine[0] += count
+
+    # --- 出力 ---
+
+    def to_frame(self, rules=None) -> pd.DataFrame:
+        """scope='kind' の行（種別ごと）と scope='rule' の行（ルールごと）を 1 つにまとめる。
+
+        rules に RuleEngine を渡すと、パターン文字列と未評価のルールも含める。
+        """
+        records = []
+        for kind, c in sorted(self.kinds.items()):
+            rows = c[_ROWS]
+            records.append({
+                'scope': 'kind', '種別': kind, 'rule': None, 'pattern': None,
+                'rows': rows, 'seconds': round(c[_NS] / 1e9, 6),
+                'us_per_row': round(c[_NS] / rows / 1000, 2) if rows else None,
+                'regex_evals': c[_EVALS],
+                'regex_per_row': round(c[_EVALS] / rows, 3) if rows else None,
+                'mapped': c[_MAPPED], 'clip': c[_CLIP], 'default_fill': c[_DEFAULT],
+                'attempts': None, 'hits': None,
+            })
+
+        keys = set(self.rules)
+        patterns: Dict[Tuple[str, int], str] = {}
+        if rules is not None:
+            for kind, matcher in rules.matchers.items():
+                for idx, (pattern, _) in enumerate(matcher.rules):
+                    patterns[(kind, idx)] = pattern.pattern
+            keys |= set(patterns)
+        for kind, idx in sorted(keys):
+            attempts, hits = self.rules.get((kind, idx), (0, 0))
+            records.append({
+                'scope': 'rule', '種別': kind, 'rule': idx, 'pattern': patterns.get((kind, idx)),
+                'attempts': attempts, 'hits': hits,
+            })
+        for (kind, series_raw), (count, match) in sorted(self.series_hits.items()):
+            records.append({
+                'scope': 'series', '種別': kind, 'rows': count, 'series': series_raw,
+                'series_key': match.key, 'series_short': match.short,
+                'method': match.method, 'confidence': match.confidence,
+            })
+        columns = ['scope', '種別', 'rule', 'pattern', 'rows', 'seconds', 'us_per_row', 'regex_evals',
+                   'regex_per_row', 'mapped', 'clip', 'default_fill', 'attempts', 'hits',
+                   'series', 'series_key', 'series_short', 'method', 'confidence']
+        return pd.DataFrame(records, columns=columns)
+
+    def save(self, log_dir: str, rules=None) -> Optional[str]:
+        """log_dir に conversion_stats_<日時>.tsv を書き出してパスを返す。"""
+        if not self.kinds and not self.rules and not self.series_hits:
+            return None
+        os.makedirs(log_dir or '.', exist_ok=True)
+        ts = datetime.now().strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(log_dir or '.', f"conversion_stats_{ts}.tsv")
+        self.to_frame(rules).to_csv(path, sep='\t', index=False, encoding='utf-8')
+        return path
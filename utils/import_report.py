@@ -0,0 +1,96 @@
+"""utils/import_report.py
+
+ブロック読み込み時の import 時間レポート（python -X importtime を子プロセスで実行して集計）。
+リポジトリ直下で実行する:
+
+    python -m utils.import_report
+    python -m utils.import_report --top 30 --budget-ms 1500
+
+各ブロックを Mage と同じように読み込み（デコレーターは素通し）、
+- 累計時間の大きいモジュール上位 N 件と合計
+- 読み込み時に入ってはいけない重いモジュール（camelot / cv2 / chardet）
+を表示する。重いモジュールが入った、または --budget-ms を超えたら終了コード 1 を返すので、
+CI でそのまま回帰チェックに使える（python -m utils.regression_checks でも DEFAULT_BUDGET_MS で確認する）。
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+__all__ = ['BLOCKS', 'FORBIDDEN', 'DEFAULT_BUDGET_MS', 'import_times', 'check']
+
+ROOT = Path(__file__).resolve().parent.parent
+BLOCKS = ('transformers/book_title_transformer.py', 'transformers/pdf_to_csv.py')
+# 実際に PDF を処理する・文字コードの推定に落ちるまで読み込まないもの
+# （pyarrow は入っていれば pandas 自身が読み込むので対象外。columnar_output 側は遅延 import）
+FORBIDDEN = ('camelot', 'cv2', 'chardet')
+DEFAULT_BUDGET_MS = 1500.0       # utils.regression_checks が使う上限（pandas の import が大半）
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+_LOADER = (
+    "import runpy, sys\n"
+    "sys.path.insert(0, {root!r})\n"
+    "identity = lambda f: f\n"
+    "runpy.run_path({path!r}, init_globals={{'transformer': identity, 'test': identity}})\n"
+)
+
+
+def import_times(block: str) -> Dict[str, int]:
+    """block を新しいプロセスで読み込み、{モジュール名: 累計 µs} を返す（'' はトップレベルの合計）。"""
+    code = _LOADER.format(root=str(ROOT), path=str(ROOT / block))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                          capture_output=True, text=True, check=False)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{block} の読み込みに失敗しました:\n{proc.stderr[-2000:]}")
+
+    times: Dict[str, int] = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if not m:
+            continue
+        cumulative, indent, name = int(m.group(2)), len(m.group(3)), m.group(4)
+        times[name] = cumulative
+        if indent == 1:                         # トップレベルの import だけ足すと二重計上しない
+            total += cumulative
+    times[''] = total
+    return times
+
+
+def check(blocks: Sequence[str] = BLOCKS, top: int = 15, budget_ms: Optional[float] = None,
+          forbidden: Sequence[str] = FORBIDDEN) -> List[str]:
+    """レポートを表示し、問題点のリスト（空なら OK）を返す。"""
+    problems: List[str] = []
+    for block in blocks:
+        times = import_times(block)
+        total_ms = times.pop('') / 1000
+        print(f"[IMPORT] {block}: {total_ms:.1f} ms")
+        for name, us in sorted(times.items(), key=lambda kv: -kv[1])[:top]:
+            print(f"  {us / 1000:9.1f} ms  {name}")
+
+        loaded = sorted({name.split('.')[0] for name in times} & set(forbidden))
+        if loaded:
+            problems.append(f"{block}: 読み込み時に {', '.join(loaded)} を import しています")
+        if budget_ms is not None and total_ms > budget_ms:
+            problems.append(f"{block}: {total_ms:.1f} ms > 予算 {budget_ms:.1f} ms")
+    return problems
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog='python -m utils.import_report', description=__doc__.split('\n\n')[0])
+    ap.add_argument('blocks', nargs='*', default=list(BLOCKS), help='対象ブロック（既定は全ブロック）')
+    ap.add_argument('--top', type=int, default=15)
+    ap.add_argument('--budget-ms', type=float, help='ブロックごとの import 時間の上限')
+    args = ap.parse_args(argv)
+
+    problems = check(args.blocks, top=args.top, budget_ms=args.budget_ms)
+    for p in problems:
+        print(f"[NG] {p}")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
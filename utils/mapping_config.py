@@ -180,3 +180,7 @@ SERIES_MAPPING = {
     "わんだふるぷりきゅあ！": "わんぷり",
     # ここにどんどん追加 …
 }
+
+# ▼ SERIES_MAPPING のあいまい一致のしきい値（Dice 係数 0〜1）。None で無効（表記揺れの吸収のみ）
+#   有効にした場合、あいまい一致したものは確信度付きで未登録シリーズのログにも出る
+SERIES_FUZZY_THRESHOLD = None
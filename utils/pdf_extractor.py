@@ -0,0 +1,381 @@
+"""utils/pdf_extractor.py
+
+PDF 1 ファイル分のテーブル抽出（transformers/pdf_to_csv.py から利用）。
+
+- extract_pdf  : 1 PDF → 全ページの表を結合・空行除去して `<stem>.csv` を書き出す
+                 失敗時は `<stem>_error.txt` にトレースバックを保存する
+- iter_extract : 複数 PDF を ProcessPoolExecutor で並列に処理し、終わった順に結果を返す
+
+page_batch を指定すると、ページを page_batch 枚ずつ camelot に渡し、得られた表を
+その場で CSV に追記して破棄する。メモリ使用量と最初の行が書かれるまでの時間は
+文書全体ではなくバッチの大きさで決まる（この場合 ExtractResult.df は None）。
+
+prescan=True（既定）のときは、camelot の前に pypdfium2 で各ページのオブジェクトだけを見て
+（描画はしない）表がありそうなページを選び、そのページだけを camelot に渡す。
+lattice は罫線で表を見つけ、セルの文字はテキストレイヤーから取るので、
+- テキストが無いページ（白紙・画像だけ）は、表が見つかっても空行として捨てられる
+- 縦横それぞれ 2 本以上の罫線（細い線・矩形のパス）も画像も無いページでは表が見つからない
+のどちらかに当たるページは飛ばす。選んだページは ExtractResult.messages に記録する。
+pypdfium2 が無い・PDF を開けない・flavor が lattice 以外のときは従来どおり全ページを渡す。
+
+ワーカープロセスから import できるよう、Mage ブロックではなく本モジュールに置く。
+camelot（OpenCV / Ghostscript を引き込むので重い）は実際に PDF を処理するときに初めて読み込む。
+ログ出力はワーカー側では行わず、ExtractResult.messages に積んで親プロセスで表示する。
+"""
+
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from importlib import metadata
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+__all__ = ['ExtractResult', 'extract_pdf', 'iter_extract', 'extract_params', 'prescan_pages', 'count_pages']
+
+# camelot.read_pdf に渡すパラメータ（抽出キャッシュのキーにも使う）
+READ_PDF_KWARGS = {'pages': 'all'}
+
+# 事前走査の判定（変えたら PRESCAN_VERSION も上げて抽出キャッシュを無効にする）
+PRESCAN_VERSION = 1
+PRESCAN_MIN_LINES = 2          # lattice が表と認識するには縦横それぞれ 2 本以上の罫線が要る
+_THIN_PT = 2.0                 # これより細いパスは罫線（横線 / 縦線）とみなす
+
+
+@dataclass
+class ExtractResult:
+    name: str
+    status: str = 'error'               # ok / no_tables / blank / error / crashed（ワーカー・プールの異常）
+    pages: int = 0
+    seconds: float = 0.0
+    df: Optional[pd.DataFrame] = None
+    csv_path: Optional[Path] = None
+    messages: List[str] = field(default_factory=list)
+
+
+class ExtractTimeout(BaseException):
+    """制限時間超過。camelot 内部の `except Exception` に握りつぶされないよう BaseException 派生。"""
+
+
+def _alarm_usable() -> bool:
+    """このスレッドで SIGALRM による制限時間が使えるか（SIGALRM のある OS のメインスレッドのみ）。"""
+    return hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread()
+
+
+@contextmanager
+def _time_limit(seconds: Optional[float]):
+    """SIGALRM で 1 ファイルあたりの処理時間を制限する。制限を掛けられたかどうかを返す。"""
+    if not seconds or not _alarm_usable():
+        yield False
+        return
+
+    def _raise(signum, frame):
+        raise ExtractTimeout(f"{seconds} 秒を超えたため中断しました")
+
+    previous = signal.signal(signal.SIGALRM, _raise)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield True
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _camelot():
+    import camelot  # type: ignore
+    return camelot
+
+
+def _camelot_version() -> str:
+    """camelot を import せずにバージョンを調べる（読み込み済みならそれを使う）。"""
+    if 'camelot' in sys.modules:
+        return getattr(sys.modules['camelot'], '__version__', '')
+    try:
+        return metadata.version('camelot-py')
+    except metadata.PackageNotFoundError:
+        return getattr(_camelot(), '__version__', '')
+
+
+def extract_params(prescan: bool = True) -> dict:
+    """抽出結果に影響するパラメータ一式（camelot のバージョンを含む）。"""
+    params = {'camelot': _camelot_version(), **READ_PDF_KWARGS}
+    if prescan and _prescan_applies():
+        params['prescan'] = PRESCAN_VERSION
+    return params
+
+
+# --- 表のありそうなページの事前走査 -------------------------------------------
+
+def _prescan_applies() -> bool:
+    return READ_PDF_KWARGS.get('flavor', 'lattice') == 'lattice'
+
+
+def _page_may_have_table(page, pdfium_c) -> bool:
+    has_text = has_image = False
+    horizontal = vertical = 0
+    for obj in page.get_objects():          # Form XObject の中も辿る
+        kind = obj.type
+        if kind == pdfium_c.FPDF_PAGEOBJ_TEXT:
+            has_text = True
+        elif kind == pdfium_c.FPDF_PAGEOBJ_IMAGE:
+            has_image = True                # 画像に描かれた罫線も lattice は拾う
+        elif kind == pdfium_c.FPDF_PAGEOBJ_PATH:
+            left, bottom, right, top = obj.get_bounds()
+            width, height = right - left, top - bottom
+            if height <= _THIN_PT < width:
+                horizontal += 1
+            elif width <= _THIN_PT < height:
+                vertical += 1
+            elif width > _THIN_PT and height > _THIN_PT:
+                # 矩形・格子を 1 つのパスで描いたもの（枠線だけでも 1 セルの表になる）
+                horizontal += 2
+                vertical += 2
+        if has_text and (has_image or (horizontal >= PRESCAN_MIN_LINES and vertical >= PRESCAN_MIN_LINES)):
+            return True
+    return False
+
+
+def prescan_pages(pdf_path: str) -> Optional[Tuple[List[int], int]]:
+    """(表がありそうなページ番号（1 始まり）, 総ページ数) を返す。判定できなければ None。"""
+    if not _prescan_applies():
+        return None
+    try:
+        import pypdfium2 as pdfium
+        import pypdfium2.raw as pdfium_c
+    except ImportError:
+        return None
+    try:
+        doc = pdfium.PdfDocument(str(pdf_path))
+    except Exception:                       # 暗号化・破損などは camelot 側の判定に任せる
+        return None
+    try:
+        pages = []
+        for i in range(len(doc)):
+            page = doc[i]
+            try:
+                if _page_may_have_table(page, pdfium_c):
+                    pages.append(i + 1)
+            finally:
+                page.close()
+        return pages, len(doc)
+    finally:
+        doc.close()
+
+
+def count_pages(pdf_path: str) -> int:
+    """総ページ数。pypdfium2 はページを解析せずに数えられるので、使えなければ camelot に任せる。"""
+    try:
+        import pypdfium2 as pdfium
+        doc = pdfium.PdfDocument(str(pdf_path))
+    except Exception:                       # 未導入・暗号化・破損
+        from camelot.handlers import PDFHandler  # type: ignore
+        return len(PDFHandler(str(pdf_path), pages="all").pages)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def _page_ranges(pages: Sequence[int]) -> str:
+    """[1, 2, 3, 7] → '1-3,7'（camelot の pages 指定と同じ書式）。"""
+    spans: List[str] = []
+    start = prev = None
+    for p in pages:
+        if prev is not None and p == prev + 1:
+            prev = p
+            continue
+        if start is not None:
+            spans.append(str(start) if start == prev else f"{start}-{prev}")
+        start = prev = p
+    if start is not None:
+        spans.append(str(start) if start == prev else f"{start}-{prev}")
+    return ','.join(spans)
+
+
+def clean_tables(dfs: Sequence[pd.DataFrame]) -> pd.DataFrame:
+    """同 PDF から得たテーブルを結合し、空白セル → NA 置換後に全列 NA の行を除外する。"""
+    df_pdf = pd.concat(dfs, ignore_index=True)
+    return (
+        df_pdf.replace(r"^\s*$", pd.NA, regex=True)
+              .dropna(how="all")
+    )
+
+
+def _append_csv(df: pd.DataFrame, csv_path: Path, first: bool) -> None:
+    if first:
+        df.to_csv(csv_path, index=False, encoding="utf-8-sig")
+    else:
+        # 追記時は BOM を付けない
+        df.to_csv(csv_path, index=False, header=False, mode="a", encoding="utf-8")
+
+
+def _widen_csv(csv_path: Path, width: int, chunksize: int = 50_000) -> None:
+    """途中のバッチで列が増えた場合に、ヘッダーと既存行を最大列数へ揃えて書き直す。"""
+    tmp = csv_path.with_suffix(".tmp")
+    reader = pd.read_csv(csv_path, encoding="utf-8-sig", dtype=str, keep_default_na=False,
+                         na_values=[""], header=None, skiprows=1, names=list(range(width)),
+                         chunksize=chunksize)
+    first = True
+    for chunk in reader:
+        _append_csv(chunk, tmp, first)
+        first = False
+    os.replace(tmp, csv_path)
+
+
+def _extract_batched(pdf_path: Path, pages: List[int], page_batch: int, csv_path: Path) -> Tuple[int, int]:
+    """page_batch ページずつ抽出して CSV に追記する。(表の数, 書き出した行数) を返す。"""
+    n_tables = rows = width = 0
+    grown = False
+    for start in range(0, len(pages), page_batch):
+        batch = pages[start:start + page_batch]
+        tables = _camelot().read_pdf(str(pdf_path), **{**READ_PDF_KWARGS, 'pages': ','.join(map(str, batch))})
+        n_tables += len(tables)
+        if not tables:
+            continue
+        df_batch = clean_tables([t.df for t in tables])
+        del tables
+        if df_batch.empty:
+            continue
+
+        if rows and df_batch.shape[1] > width:
+            grown = True
+        width = max(width, df_batch.shape[1])
+        _append_csv(df_batch.reindex(columns=range(width)), csv_path, first=not rows)
+        rows += len(df_batch)
+        del df_batch
+
+    if grown:
+        _widen_csv(csv_path, width)
+    return n_tables, rows
+
+
+def extract_pdf(pdf_path: str, root: str, out_dir: str, timeout: Optional[float] = None,
+                page_batch: Optional[int] = None, prescan: bool = True) -> ExtractResult:
+    """1 PDF の全ページ（prescan=True なら表がありそうなページ）から表を抽出して CSV に保存する。"""
+    pdf_path, root, out_dir = Path(pdf_path), Path(root), Path(out_dir)
+    result = ExtractResult(pdf_path.name)
+    started = time.perf_counter()
+    try:
+        with _time_limit(timeout) as limited:
+            if timeout and not limited:
+                result.messages.append(f"⚠️  timeout={timeout} を掛けられないため無視しました（SIGALRM が無い、またはメインスレッド以外）")
+            scanned = prescan_pages(pdf_path) if prescan else None
+            if scanned is not None:
+                pages, result.pages = scanned
+                result.messages.append(
+                    f"🔎 Pre-scan: {len(pages)}/{result.pages} pages → {_page_ranges(pages) or '(none)'}")
+                if not pages:
+                    result.status = 'no_tables'
+                    result.messages.append(f"⚠️  No tables found in {pdf_path.relative_to(root)} — skipped")
+                    return result
+            else:
+                result.pages = count_pages(pdf_path)
+                pages = list(range(1, result.pages + 1))
+
+            if page_batch:
+                # ---- page_batch 枚ずつ抽出して追記 ----
+                csv_path = out_dir / f"{pdf_path.stem}.csv"
+                n_tables, rows = _extract_batched(pdf_path, pages, int(page_batch), csv_path)
+                if not n_tables:
+                    result.status = 'no_tables'
+                    result.messages.append(f"⚠️  No tables found in {pdf_path.relative_to(root)} — skipped")
+                    return result
+                if not rows:
+                    result.status = 'blank'
+                    result.messages.append(f"⚠️  Only blank rows in {pdf_path.name} — skipped")
+                    return result
+                result.messages.append(f"✅  CSV written → {csv_path.relative_to(root)} ({rows} rows)")
+                result.status = 'ok'
+                result.csv_path = csv_path
+                return result
+
+            # ---- 全ページの表を抽出 ----
+            read_kwargs = READ_PDF_KWARGS
+            if scanned is not None:
+                read_kwargs = {**READ_PDF_KWARGS, 'pages': _page_ranges(pages)}
+            tables = _camelot().read_pdf(str(pdf_path), **read_kwargs)
+            if not tables:
+                result.status = 'no_tables'
+                result.messages.append(f"⚠️  No tables found in {pdf_path.relative_to(root)} — skipped")
+                return result
+
+            # ---- 同 PDF から得たテーブルを結合 ----
+            df_pdf = clean_tables([t.df for t in tables])
+            if df_pdf.empty:
+                result.status = 'blank'
+                result.messages.append(f"⚠️  Only blank rows in {pdf_path.name} — skipped")
+                return result
+
+            # ---- CSV 書き出し ----
+            csv_path = out_dir / f"{pdf_path.stem}.csv"
+            df_pdf.to_csv(csv_path, index=False, encoding="utf-8-sig")
+            result.messages.append(f"✅  CSV written → {csv_path.relative_to(root)}")
+
+        result.status = 'ok'
+        result.df = df_pdf
+        result.csv_path = csv_path
+
+    except (Exception, ExtractTimeout) as err:
+        # 個別 PDF の失敗はログ化して続行
+        result.status = 'error'
+        result.messages.append(f"❌ ERROR processing {pdf_path.name}: {err.__class__.__name__}: {err}")
+        err_file = out_dir / f"{pdf_path.stem}_error.txt"
+        err_file.write_text(traceback.format_exc(), encoding="utf-8")
+        result.messages.append(f"   ↳ 詳細は {err_file.relative_to(root)} に保存しました")
+
+    finally:
+        result.seconds = time.perf_counter() - started
+    return result
+
+
+def iter_extract(pdf_paths: Sequence[Path], root: Path, out_dir: Path,
+                 workers: Optional[int] = None,
+                 timeout: Optional[float] = None,
+                 page_batch: Optional[int] = None,
+                 prescan: bool = True) -> Iterator[Tuple[int, ExtractResult]]:
+    """(入力順の番号, 結果) を処理が終わった順に返す。workers=1 なら逐次処理。
+
+    timeout を指定して逐次処理になる場合でも、このスレッドで SIGALRM が使えなければ
+    （Mage はブロックを別スレッドで実行する）1 ワーカーのプロセスで処理して制限時間を守る。
+    """
+    workers = workers or os.cpu_count() or 1
+    serial = workers <= 1 or len(pdf_paths) <= 1
+    if serial and pdf_paths and timeout and hasattr(signal, 'SIGALRM') and not _alarm_usable():
+        serial = False
+    if serial:
+        for i, path in enumerate(pdf_paths):
+            yield i, extract_pdf(str(path), str(root), str(out_dir), timeout, page_batch, prescan)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(pdf_paths))) as pool:
+        futures = {
+            pool.submit(extract_pdf, str(path), str(root), str(out_dir), timeout, page_batch, prescan): i
+            for i, path in enumerate(pdf_paths)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            yield i, _future_result(future, Path(pdf_paths[i]), root, out_dir)
+
+
+def _future_result(future, pdf_path: Path, root: Path, out_dir: Path) -> ExtractResult:
+    """ワーカーの結果。ワーカー自体が落ちた（BrokenProcessPool など）場合は status='crashed'。
+
+    プールが壊れると、落ちた PDF 以外の処理待ちの PDF もすべて同じ例外になるので、
+    ファイル自体の失敗とは区別する（crashed はマニフェストに記録せず、次回また抽出する）。
+    """
+    try:
+        return future.result()
+    except Exception as err:
+        result = ExtractResult(pdf_path.name, status='crashed', messages=[
+            f"❌ ERROR processing {pdf_path.name}: {err.__class__.__name__}: {err}（ワーカー異常のため次回再抽出）"])
+        err_file = Path(out_dir) / f"{pdf_path.stem}_error.txt"
+        err_file.write_text(''.join(traceback.format_exception(err)), encoding="utf-8")
+        result.messages.append(f"   ↳ 詳細は {err_file.relative_to(root)} に保存しました")
+        return result
@@ -0,0 +1,120 @@
+"""utils/pdf_manifest.py
+
+pdf_to_csv 用の抽出キャッシュ（output/.pdf_manifest.json）。
+
+- PDF ごとに「指紋」と「camelot の抽出パラメータ」を記録する
+  * 既定  : ファイル内容の SHA-256
+  * fast  : サイズ + mtime（読み込み不要だが、内容を書き換えて mtime を戻すと検知できない）
+- 指紋とパラメータが前回と同じで、前回成功していれば output/<stem>.csv を読み直して使う
+- 前回失敗したファイル（status='error'）は毎回再抽出する。skip_failed=True のときだけ、
+  変更されていなければ前回の失敗をそのまま使う
+- ワーカー・プールの異常（status='crashed'）はファイルの結果ではないので記録しない
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import pandas as pd
+
+__all__ = ['PdfManifest', 'RECORDED_STATUSES', 'load_cached_csv', 'iter_cached_csv']
+
+MANIFEST_NAME = '.pdf_manifest.json'
+MANIFEST_VERSION = 1
+RECORDED_STATUSES = ('ok', 'no_tables', 'blank', 'error')
+
+
+def _fingerprint(path: Path, fast: bool) -> str:
+    st = path.stat()
+    if fast:
+        return f"size={st.st_size};mtime={st.st_mtime_ns}"
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return f"sha256={h.hexdigest()}"
+
+
+_CSV_OPTIONS = dict(encoding='utf-8-sig', dtype=str, keep_default_na=False, na_values=[''])
+
+
+def _restore_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = [int(c) if str(c).isdigit() else c for c in df.columns]
+    return df
+
+
+def load_cached_csv(csv_path: Path) -> pd.DataFrame:
+    """extract_pdf が書いた CSV を、抽出直後と同じ形（列名 0,1,2… / 空セルは NA）で読み直す。"""
+    return _restore_columns(pd.read_csv(csv_path, **_CSV_OPTIONS))
+
+
+def iter_cached_csv(csv_path: Path, chunksize: int) -> Iterator[pd.DataFrame]:
+    """load_cached_csv と同じ形で chunksize 行ずつ返す。"""
+    with pd.read_csv(csv_path, chunksize=chunksize, **_CSV_OPTIONS) as reader:
+        for chunk in reader:
+            yield _restore_columns(chunk)
+
+
+class PdfManifest:
+    """PDF ファイル名 → {fingerprint, params, status, pages, csv(output/ 内のファイル名)} の JSON マニフェスト。"""
+
+    def __init__(self, out_dir: Path, params: Dict, fast: bool = False):
+        self.path = Path(out_dir) / MANIFEST_NAME
+        self.params = params
+        self.fast = fast
+        self.entries: Dict[str, Dict] = {}
+        self._seen: Dict[str, Dict] = {}
+        if self.path.exists():
+            saved = json.loads(self.path.read_text(encoding='utf-8'))
+            if saved.get('version') == MANIFEST_VERSION:
+                self.entries = saved.get('files', {})
+
+    def fingerprint(self, pdf_path: Path) -> str:
+        return _fingerprint(pdf_path, self.fast)
+
+    def lookup(self, pdf_path: Path, fingerprint: str,
+               skip_failed: bool = False, force: bool = False) -> Optional[Dict]:
+        """再抽出が不要なら前回のエントリを、必要なら None を返す。
+
+        前回 error だったものは skip_failed=True のときだけ「最新」とみなす。
+        """
+        entry = self.entries.get(pdf_path.name)
+        if force or entry is None:
+            return None
+        if entry.get('fingerprint') != fingerprint or entry.get('params') != self.params:
+            return None
+        if entry.get('status') not in RECORDED_STATUSES:
+            return None
+        if entry.get('status') == 'error' and not skip_failed:
+            return None
+        if entry.get('status') == 'ok' and not self.csv_path(entry).exists():
+            return None
+        self._seen[pdf_path.name] = entry
+        return entry
+
+    def csv_path(self, entry: Dict) -> Path:
+        return self.path.parent / entry.get('csv', '')
+
+    def record(self, pdf_path: Path, fingerprint: str, status: str, pages: int,
+               csv_path: Optional[Path]) -> None:
+        """抽出結果を記録する。crashed など RECORDED_STATUSES 以外は記録しない（次回また抽出する）。"""
+        if status not in RECORDED_STATUSES:
+            self._seen.pop(pdf_path.name, None)
+            return
+        self._seen[pdf_path.name] = {
+            'fingerprint': fingerprint,
+            'params': self.params,
+            'status': status,
+            'pages': pages,
+            'csv': csv_path.name if csv_path else '',
+        }
+
+    def save(self) -> None:
+        """今回の入力に含まれる PDF のエントリだけを書き出す。"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'version': MANIFEST_VERSION, 'files': self._seen},
+                                  ensure_ascii=False, indent=1), encoding='utf-8')
+        os.replace(tmp, self.path)
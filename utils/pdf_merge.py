@@ -0,0 +1,139 @@
+"""utils/pdf_merge.py
+
+pdf_to_csv の結合段（PDF ごとの表を 1 つの output/_merged.csv にまとめる）。
+
+- 各 PDF の結果は終わった時点で put() する。入力順（ファイル名順）の先頭から
+  揃ったものをその場で _merged.csv に追記し、DataFrame は手放す
+  （順番待ちの PDF は output/<stem>.csv から後で読み直すので、メモリには残さない）
+- 列は初出順の和集合（従来の pd.concat(sort=False) と同じ並び）。途中で列が増えたら、
+  最後に既存の行を新しい列に揃えて書き直す
+- 同時にメモリに載るのは 1 PDF（page_batch 時は chunksize 行）ぶんだけ
+
+結合済みの DataFrame が要るときは to_frame()（_merged.csv を 1 回読むだけ）、
+要らなければ _merged.csv をそのまま使う（iter_cached_csv で少しずつ読める）。
+to_frame() の結果は全 PDF の行を持つので、メモリが 1 PDF ぶんで済むのは使わない場合だけ。
+
+input/_merged.pdf があると、その PDF ごとの出力 output/_merged.csv が結合結果と重なるので
+merged_path() で拒否する（大文字小文字だけ違う名前も、区別しないファイルシステムでは重なる）。
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from utils.pdf_manifest import iter_cached_csv
+
+__all__ = ['TableMerger', 'MERGED_CSV', 'merged_path']
+
+MERGED_CSV = '_merged.csv'
+CHUNKSIZE = 20_000
+
+
+def merged_path(out_dir: Path, pdf_paths: List[Path]) -> Path:
+    """結合結果のパス。PDF ごとの出力（<stem>.csv）と重なるなら ValueError。"""
+    path = Path(out_dir) / MERGED_CSV
+    for pdf_path in pdf_paths:
+        if f"{Path(pdf_path).stem}.csv".casefold() == MERGED_CSV.casefold():
+            raise ValueError(f"{Path(pdf_path).name} の出力が結合結果 {path.name} と重なります。"
+                             "PDF の名前を変えてください")
+    return path
+
+
+class TableMerger:
+    """n 個の抽出結果を入力順に 1 つの CSV へ追記する。"""
+
+    def __init__(self, n: int, path: Path, chunksize: int = CHUNKSIZE):
+        self.path = Path(path)
+        self.chunksize = chunksize
+        self.columns: List = []
+        self.rows: List[int] = [0] * n
+        self._pending: Dict[int, object] = {}
+        self._next = 0
+        self._written = 0
+        self._grown = False
+        self._tmp = self.path.with_suffix('.tmp')
+        if self._tmp.exists():
+            self._tmp.unlink()
+
+    @property
+    def total_rows(self) -> int:
+        return self._written
+
+    def put(self, i: int, result) -> None:
+        """i 番目の結果（ExtractResult）を受け取り、先頭から揃った分を書き出す。"""
+        self._pending[i] = result
+        while self._next in self._pending:
+            r = self._pending.pop(self._next)
+            if r is not None and r.status == 'ok' and r.csv_path:
+                self.rows[self._next] = self._append(r)
+            self._next += 1
+        for r in self._pending.values():    # 順番待ちの間は CSV に任せる
+            if r is not None:
+                r.df = None
+
+    def _append(self, result) -> int:
+        if result.df is not None:
+            chunks = [result.df]
+        else:
+            chunks = iter_cached_csv(result.csv_path, self.chunksize)
+        rows = 0
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            known = set(self.columns)
+            new = [c for c in chunk.columns if c not in known]
+            if new:
+                self._grown = self._grown or self._written > 0
+                self.columns.extend(new)
+            aligned = chunk.reindex(columns=self.columns)
+            if self._written == 0:
+                aligned.to_csv(self._tmp, index=False, encoding='utf-8-sig')
+            else:
+                aligned.to_csv(self._tmp, index=False, header=False, mode='a', encoding='utf-8')
+            self._written += len(aligned)
+            rows += len(aligned)
+        result.df = None
+        return rows
+
+    def close(self) -> Optional[Path]:
+        """_merged.csv を確定してパスを返す（1 行も無ければ消して None）。"""
+        if not self._written:
+            for p in (self._tmp, self.path):
+                if p.exists():
+                    p.unlink()
+            return None
+        if self._grown:
+            self._widen()
+        os.replace(self._tmp, self.path)
+        return self.path
+
+    def _widen(self) -> None:
+        """列が増える前に書いた行を、最終的な列の並びに揃えて書き直す。"""
+        widened = self._tmp.with_suffix('.wide')
+        reader = pd.read_csv(self._tmp, encoding='utf-8-sig', dtype=str, keep_default_na=False,
+                             na_values=[''], header=None, skiprows=1,
+                             names=[str(c) for c in self.columns], chunksize=self.chunksize)
+        first = True
+        with reader:
+            for chunk in reader:
+                if first:
+                    chunk.to_csv(widened, index=False, encoding='utf-8-sig')
+                else:
+                    chunk.to_csv(widened, index=False, header=False, mode='a', encoding='utf-8')
+                first = False
+        os.replace(widened, self._tmp)
+
+    def to_frame(self) -> pd.DataFrame:
+        """結合結果の DataFrame（close() の後に呼ぶ）。全行をメモリに載せる。
+
+        chunksize 行ずつ読んで連結する。文字列列が Arrow 実装なら連結はチャンクを束ねるだけなので、
+        ピークは結果そのもの + 1 チャンク分で済む（1 回で読むとパーサーの作業領域が上乗せされる）。
+        """
+        if not self._written:
+            return pd.DataFrame()
+        chunks = list(iter_cached_csv(self.path, self.chunksize))
+        if len(chunks) == 1:
+            return chunks[0]
+        return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,326 @@
+"""utils/regression_checks.py
+
+変換・キャッシュまわりの回帰チェック（ブロックの @test から切り離した単体チェック）。
+Mage の @test は本番実行のたびに呼ばれるので、そこには返り値の検証だけを置き、
+リテラルのデータ・一時ディレクトリで再現する単体チェックはこちらにまとめる。
+リポジトリ直下で実行する:
+
+    python -m utils.regression_checks
+    python -m utils.regression_checks series        # 名前に含む語で絞り込み
+
+各チェックは mapping_config の中身・sys.modules・sys.path に依存も変更もしない。
+失敗があれば終了コード 1 を返すので、utils.import_report と同じく CI でそのまま使える。
+"""
+
+import argparse
+import sys
+import traceback
+import types
+from typing import Callable, List
+
+__all__ = ['CHECKS', 'run']
+
+CHECKS: List[Callable[[], None]] = []
+
+
+def _check(fn: Callable[[], None]) -> Callable[[], None]:
+    CHECKS.append(fn)
+    return fn
+
+
+# --- 名称中の外字と日付トークン（user-003）-----------------------------------
+
+_PUA_ROWS = [
+    # (種別, 名称, 2024-03-05 に展開した変換後)。cp932 の F040 / F041 は U+E000 / U+E001 になる
+    ('コミック', '[作者]タイトル\ue000', '[作者]タイトル\ue000'),
+    ('成年コミック', '[作者]本\ue001', '成[作者][出版社](20240305)本\ue001'),
+    ('同人', '(C105) [作者] 本\ue000', '同[作者](C105)本\ue000 (C105)'),
+    ('コミック', '[作者]\ue002\ue000', '[作者]\ue002\ue000'),
+]
+
+
+@_check
+def check_pua_name_is_not_a_date():
+    """名称に含まれる外字（日付トークンと同じ文字）は日付に置き換わらず、キャッシュを経由しても同じ。"""
+    import os
+    import tempfile
+    from datetime import datetime
+
+    import pandas as pd
+    from utils import title_normalizer as tn
+    from utils.rule_engine import RuleEngine
+    from utils.title_cache import TitleCache, render_template
+
+    now = datetime(2024, 3, 5)
+    rules = RuleEngine(types.SimpleNamespace(PREFIX_MAPPING={'成年コミック': '成', '同人': '同'}))
+    kinds = pd.Series([k for k, _, _ in _PUA_ROWS])
+    names = pd.Series([n for _, n, _ in _PUA_ROWS])
+    expected = [e for _, _, e in _PUA_ROWS]
+
+    def convert_many(kinds, names):
+        pairs = [tn.convert_one(k, n, rules) for k, n in zip(kinds, names)]
+        return (pd.Series([p[0] for p in pairs], index=kinds.index, dtype=object),
+                pd.Series([p[1] for p in pairs], index=kinds.index, dtype=object))
+
+    templates, _ = convert_many(kinds, names)
+    assert tn.render_templates(templates, now).tolist() == expected
+    assert [render_template(t, now) for t in templates] == expected
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(2):                                      # 1 回目は変換して登録、2 回目はキャッシュから
+            with TitleCache(os.path.join(tmp, 'c.sqlite'), 'h', 'ns') as cache:
+                templates, _ = tn.convert_cached(kinds, names, cache, convert_many)
+            assert tn.render_templates(templates, now).tolist() == expected
+
+
+@_check
+def check_pua_row_and_vectorized_paths_agree():
+    """行単位と vectorized で、外字を含む名称の変換結果が同じ。"""
+    import pandas as pd
+    from utils import title_normalizer as tn
+
+    kinds = pd.Series([k for k, _, _ in _PUA_ROWS] + ['美術', '成年雑誌'])
+    names = pd.Series([n for _, n, _ in _PUA_ROWS] + ['画集\ue001', '\ue000'])
+    rows, rows_unknown = tn.convert_rows(kinds, names)
+    vec, vec_unknown = tn.convert_vectorized(kinds, names)
+    assert rows.tolist() == vec.tolist() and rows_unknown.tolist() == vec_unknown.tolist()
+
+
+# --- 差分処理のマニフェスト（user-004）--------------------------------------
+
+@_check
+def check_deleted_rows_do_not_change_other_keys():
+    """行を消しても、残った行（同じ名称で種別違いを含む）は変更なしのまま。"""
+    import pandas as pd
+    from utils.row_manifest import RowManifest
+
+    df = pd.DataFrame({'種別': ['小説', 'コミック', '小説', 'コミック', '小説'],
+                       '名称': ['同名', '同名', '同名', '別名', '同名'],
+                       '巻': ['1', '1', '2', '1', '3']})
+    manifest = RowManifest('unused.json', 'rules')
+    keys, fps = RowManifest.fingerprint(df)
+    manifest.replace(keys, fps, ['o'] * 5, ['t'] * 5, [None] * 5)
+
+    kept = df.drop(index=[0]).reset_index(drop=True)
+    delta = manifest.diff(*RowManifest.fingerprint(kept))
+    assert (delta.added, delta.removed, delta.changed, delta.unchanged) == (0, 1, 0, 4), delta.summary()
+
+    edited = kept.assign(巻=['1', '2', '1', '4'])        # 種別 + 名称はそのままで中身だけ変更
+    delta = manifest.diff(*RowManifest.fingerprint(edited))
+    assert delta.todo.tolist() == [False, False, False, True], delta.todo
+    assert (delta.added, delta.removed, delta.changed) == (0, 1, 1), delta.summary()
+
+
+# --- PDF 抽出キャッシュ（user-009）-------------------------------------------
+
+@_check
+def check_crashed_worker_is_not_cached():
+    """ワーカーが落ちた PDF は _error.txt を残し、マニフェストには載らない（次回また抽出される）。"""
+    import tempfile
+    from concurrent.futures import Future
+    from concurrent.futures.process import BrokenProcessPool
+    from pathlib import Path
+    from utils.pdf_extractor import _future_result
+    from utils.pdf_manifest import PdfManifest
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        pdf = root / 'a.pdf'
+        pdf.write_bytes(b'%PDF-1.4\n')
+        future = Future()
+        future.set_exception(BrokenProcessPool('worker died'))
+        result = _future_result(future, pdf, root, root)
+        assert result.status == 'crashed', result.status
+        assert (root / 'a_error.txt').exists(), '_error.txt が書かれていない'
+
+        manifest = PdfManifest(root, {'p': 1})
+        fp = manifest.fingerprint(pdf)
+        manifest.record(pdf, fp, result.status, result.pages, result.csv_path)
+        manifest.save()
+        assert PdfManifest(root, {'p': 1}).lookup(pdf, fp) is None, 'crashed がキャッシュ扱いになった'
+
+
+@_check
+def check_cached_error_is_retried():
+    """前回 error の PDF は既定で再抽出し、skip_failed=True のときだけ飛ばす。"""
+    import tempfile
+    from pathlib import Path
+    from utils.pdf_manifest import PdfManifest
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        pdf = root / 'a.pdf'
+        pdf.write_bytes(b'%PDF-1.4\n')
+        manifest = PdfManifest(root, {'p': 1})
+        fp = manifest.fingerprint(pdf)
+        manifest.record(pdf, fp, 'error', 0, None)
+        manifest.save()
+        assert PdfManifest(root, {'p': 1}).lookup(pdf, fp) is None
+        assert PdfManifest(root, {'p': 1}).lookup(pdf, fp, skip_failed=True)['status'] == 'error'
+
+
+# --- SERIES_MAPPING の検索（user-016）---------------------------------------
+
+_SERIES = {
+    'アイドルマスター シンデレラガールズ': 'デレマス',
+    'アズールレーン': 'アズレン',
+    'グランブルーファンタジー': 'グラブル',
+    'ブルーアーカイブ': 'ブルアカ',
+    '艦隊これくしょん -艦これ-': '艦これ',
+    'ドラゴンクエストXI': 'DQ11',
+}
+
+
+@_check
+def check_series_width_variants():
+    """半角カナ・全角英数・ダッシュの揺れは正規化キーで一致する。"""
+    from utils.series_index import SeriesIndex
+
+    index = SeriesIndex(_SERIES, threshold=None)
+    for raw, short in [('ﾌﾞﾙｰｱｰｶｲﾌﾞ', 'ブルアカ'),
+                       ('ブル−アーカイブ', 'ブルアカ'),
+                       ('ｱｲﾄﾞﾙﾏｽﾀｰ　ｼﾝﾃﾞﾚﾗｶﾞｰﾙｽﾞ', 'デレマス'),
+                       ('ドラゴンクエストＸＩ', 'DQ11'),
+                       ('艦隊これくしょん－艦これ－', '艦これ'),
+                       ('艦隊これくしょん 艦これ', '艦これ')]:
+        match = index.lookup(raw)
+        assert (match.method, match.short) == ('normalized', short), (raw, match)
+
+
+@_check
+def check_series_long_vowel_is_not_dropped():
+    """カナ語の中の長音は消さない（長音違いの別の文字列を同じキーにしない）。"""
+    from utils.series_index import SeriesIndex
+
+    index = SeriesIndex(_SERIES, threshold=None)
+    for raw in ('ブルアカイブ', 'グランブルファンタジー', 'アズルレン'):
+        match = index.lookup(raw)
+        assert not match.found and match.short == raw, (raw, match)
+
+
+@_check
+def check_fuzzy_series_hits_are_logged():
+    """あいまい一致は既定で無効。有効にしたときは一致をキー・確信度付きで未登録シリーズに出す。"""
+    from utils.rule_engine import RuleEngine
+    from utils.title_normalizer import convert_one
+
+    name = '(C105) [作者] 本 (アイドルマスター シンデレラガールズ劇場)'
+    cfg = types.SimpleNamespace(PREFIX_MAPPING={'同人': '同'}, SERIES_MAPPING=_SERIES)
+    out, unknown = convert_one('同人', name, RuleEngine(cfg))
+    assert out.endswith('(アイドルマスター シンデレラガールズ劇場)'), out
+    assert unknown == 'アイドルマスター シンデレラガールズ劇場', unknown
+
+    cfg.SERIES_FUZZY_THRESHOLD = 0.85
+    out, unknown = convert_one('同人', name, RuleEngine(cfg))
+    assert out.endswith('(デレマス)'), out
+    assert unknown == 'アイドルマスター シンデレラガールズ劇場\t≈ アイドルマスター シンデレラガールズ (0.89)', unknown
+
+
+# --- ルールの変更検知とコンパイル済みルールの保存（user-018）---------------------
+
+def _probe_module(tmp: str, source: str) -> types.ModuleType:
+    """sys.modules に登録しない、一時ディレクトリのファイルを __file__ に持つモジュール。"""
+    import os
+
+    path = os.path.join(tmp, '_rules_probe.py')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(source)
+    module = types.ModuleType(f"_rules_probe_{id(path)}")
+    module.__file__ = path
+    exec(compile(source, path, 'exec'), module.__dict__)
+    return module
+
+
+@_check
+def check_rules_source_change_is_content_based():
+    """ソースは内容（sha256）が変わったときだけ「変更あり」。mtime だけの変化では読み直さない。"""
+    import os
+    import tempfile
+    import time
+    from utils import rule_engine
+
+    with tempfile.TemporaryDirectory() as tmp:
+        module = _probe_module(tmp, 'VALUE = 1\n')
+        try:
+            assert not rule_engine._source_changed(module)          # 初回は記録だけ
+            later = time.time_ns() + 10 ** 9
+            os.utime(module.__file__, ns=(later, later))
+            assert not rule_engine._source_changed(module)
+            assert not rule_engine.reload_if_changed(module)        # 変更なしなら reload しない
+            with open(module.__file__, 'w', encoding='utf-8') as f:
+                f.write('VALUE = 22\n')
+            assert rule_engine._source_changed(module)
+            assert not rule_engine._source_changed(module)
+        finally:
+            rule_engine._stamps.pop(module.__name__, None)
+
+
+@_check
+def check_compiled_rules_are_reused_and_rebuilt():
+    """保存したエンジンは次のプロセスで読み込み、壊れている・fingerprint が違えば作り直す。"""
+    import os
+    import pickle
+    import tempfile
+    from utils import rule_engine
+    from utils.rule_engine import RuleEngine
+
+    source = "PREFIX_MAPPING = {'同人': '同'}\nSERIES_MAPPING = {'ブルーアーカイブ': 'ブルアカ'}\n"
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = _probe_module(tmp, source)
+        try:
+            rule_engine._source_changed(cfg)
+            path = rule_engine._compiled_path(cfg)
+            built = rule_engine._load_or_build(cfg)
+            assert os.path.exists(path), '保存されていない'
+            loaded = rule_engine._load_or_build(cfg)
+            assert loaded is not built and loaded.fingerprint == built.fingerprint
+            assert loaded.series('ブルーアーカイブ') == 'ブルアカ'
+
+            other = RuleEngine(types.SimpleNamespace(SERIES_MAPPING={'x': 'y'}))
+            with open(path, 'wb') as f:                             # 別のルールのエンジン
+                pickle.dump(other, f)
+            rebuilt = rule_engine._load_or_build(cfg)
+            assert rebuilt.fingerprint == built.fingerprint, 'fingerprint 違いを読み込んだ'
+
+            with open(path, 'wb') as f:                             # 壊れたファイル
+                f.write(b'not a pickle')
+            assert rule_engine._load_or_build(cfg).fingerprint == built.fingerprint
+        finally:
+            rule_engine._stamps.pop(cfg.__name__, None)
+
+
+@_check
+def check_import_time_budget():
+    """ブロックの読み込みで重いモジュール（camelot など）を import せず、予算内に収まる。"""
+    from utils import import_report
+
+    problems = import_report.check(top=0, budget_ms=import_report.DEFAULT_BUDGET_MS)
+    assert not problems, problems
+
+
+# --- 実行 ---------------------------------------------------------------------
+
+def run(words=()) -> int:
+    """名前に words のどれかを含むチェック（無指定なら全部）を実行し、失敗数を返す。"""
+    failed = 0
+    for fn in CHECKS:
+        if words and not any(w in fn.__name__ for w in words):
+            continue
+        try:
+            fn()
+        except Exception:
+            failed += 1
+            print(f"[NG] {fn.__name__}\n{traceback.format_exc()}")
+        else:
+            print(f"[OK] {fn.__name__}")
+    return failed
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog='python -m utils.regression_checks', description=__doc__.split('\n\n')[0])
+    ap.add_argument('words', nargs='*', help='名前にこの語を含むチェックだけ実行')
+    args = ap.parse_args(argv)
+    return 1 if run(args.words) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
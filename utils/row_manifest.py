@@ -0,0 +1,116 @@
+"""utils/row_manifest.py
+
+rename.tsv の差分処理（incremental=True）用マニフェスト。
+
+- 行キー   : 種別 + 名称 + 行指紋 + 同じ内容の行の出現順
+             （行を消しても、ほかの行のキーは変わらない。出現順がずれるのは中身が同じ行どうしだけ）
+- 指紋     : 行全体（全列）のハッシュ
+- 変更     : キーが消えた行と新しく現れた行のうち、種別 + 名称が同じものを組にして数える
+- 前回の 変換後 / 出力日時 / 未登録シリーズ を行キーごとに保持し、
+  指紋が変わっていない行は再変換せずにそのまま使う
+- mapping_config のルールが変わったらマニフェストは無効（全件やり直し）
+"""
+
+import json
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['RowManifest', 'DeltaReport']
+
+MANIFEST_VERSION = 5     # 2: 外字（トークンと同じ文字）を含む名称の 変換後 を修正 / 3: あいまい一致も未登録シリーズに記録
+                         # 4: シリーズ名の正規化（NFKC 先行・長音保持）を変更 / 5: 行キーに種別と指紋を含める
+
+Entry = Tuple[int, str, str, Optional[str]]    # (指紋, 変換後, 出力日時, 未登録シリーズ)
+
+
+@dataclass
+class DeltaReport:
+    added: int
+    removed: int
+    changed: int
+    unchanged: int
+    todo: np.ndarray          # 再変換が必要な行（bool, 入力行順）
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def summary(self) -> str:
+        return f"追加 {self.added} / 削除 {self.removed} / 変更 {self.changed} / 変更なし {self.unchanged}"
+
+
+def _kind_name(key: str) -> str:
+    return key.rsplit('\t', 2)[0]
+
+
+class RowManifest:
+    """前回実行時の行指紋と出力を保持する JSON マニフェスト。"""
+
+    def __init__(self, path: str, rules_hash: str):
+        self.path = path
+        self.rules_hash = rules_hash
+        self.rows: Dict[str, Entry] = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('version') == MANIFEST_VERSION and saved.get('rules') == rules_hash:
+                self.rows = {k: tuple(v) for k, v in saved['rows'].items()}
+
+    @classmethod
+    def beside(cls, output_path: str, rules_hash: str) -> 'RowManifest':
+        """`<output_path>.manifest.json` を使う。"""
+        return cls(f"{output_path}.manifest.json", rules_hash)
+
+    @staticmethod
+    def fingerprint(df: pd.DataFrame) -> Tuple[List[str], np.ndarray]:
+        """行キーと行指紋（uint64）を入力行順で返す。"""
+        kinds = df['種別'].astype(object).map(str)
+        names = df['名称'].astype(object).map(str)
+        fps = pd.util.hash_pandas_object(df.astype(object), index=False).to_numpy()
+        occurrence = pd.Series(fps).groupby(fps, sort=False).cumcount()
+        keys = [f"{k}\t{n}\t{fp:016x}\t{i}" for k, n, fp, i in zip(kinds, names, fps, occurrence)]
+        return keys, fps
+
+    def diff(self, keys: List[str], fps: np.ndarray) -> DeltaReport:
+        rows = self.rows
+        todo = np.ones(len(keys), dtype=bool)
+        new: List[str] = []
+        for i, (key, fp) in enumerate(zip(keys, fps)):
+            prev = rows.get(key)
+            if prev is not None and prev[0] == int(fp):
+                todo[i] = False
+            else:
+                new.append(key)
+        gone = set(rows) - set(keys)
+        # 種別 + 名称が同じで中身だけ変わった行は「変更」として数える
+        vacant = Counter(_kind_name(k) for k in gone)
+        changed = 0
+        for key in new:
+            kind_name = _kind_name(key)
+            if vacant[kind_name]:
+                vacant[kind_name] -= 1
+                changed += 1
+        return DeltaReport(len(new) - changed, len(gone) - changed, changed, int((~todo).sum()), todo)
+
+    def previous(self, keys: List[str]) -> List[Entry]:
+        return [self.rows[k] for k in keys]
+
+    def replace(self, keys: List[str], fps: np.ndarray, outputs, stamps, unknowns) -> None:
+        """今回の入力で丸ごと置き換える（削除された行はここで消える）。"""
+        self.rows = {
+            k: (int(fp), out, stamp, unk)
+            for k, fp, out, stamp, unk in zip(keys, fps, outputs, stamps, unknowns)
+        }
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'rules': self.rules_hash, 'rows': self.rows},
+                      f, ensure_ascii=False)
+        os.replace(tmp, self.path)
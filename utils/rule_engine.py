@@ -0,0 +1,212 @@
+"""utils/rule_engine.py
+
+mapping_config のルール一式をコンパイル済みで保持する共有ルールエンジン。
+title_normalizer（normalize_titles）と title_formatter（format_title）の両方がこれを使う。
+
+- PATTERN_MAPPING   : 種別ごとの PatternMatcher（キーワードで候補を絞ってから正規表現）
+- CLIP_REGEX        : 種別ごとのコンパイル済み正規表現とグループ
+- PREFIX_MAPPING    : そのまま保持
+- SERIES_MAPPING    : SeriesIndex（正規化キーの完全一致 → bigram によるあいまい一致）
+- fingerprint       : rules_fingerprint()（キャッシュ・マニフェストの無効化キー）
+
+current() は mapping_config.py の mtime（とサイズ）が変わったときだけ内容のハッシュを取り、
+ハッシュも変わっていたときだけモジュールを reload してコンパイルし直す。
+Mage のカーネルでブロックを何度実行しても、変更が無ければ reload もコンパイルも行わない。
+
+コンパイル結果は mapping_config.py と隣の __pycache__/ に pickle で保存し、新しいプロセスでは
+（mapping_config とエンジン側のソースが同じなら）コンパイルせずにそれを読み込む。
+ファイル名は mapping_config の内容・エンジン側のソース・Python の版のハッシュで、読み込んだエンジンの
+fingerprint が今の mapping_config の rules_fingerprint() と違えば捨てて作り直す。
+（正規表現は読み込み時に再コンパイルされるので、短縮できるのはキーワード索引・SeriesIndex などの構築分）
+"""
+
+import hashlib
+import importlib
+import os
+import pickle
+import re
+import sys
+import threading
+from typing import Dict, Optional, Tuple
+
+import utils.mapping_config as map_cfg
+from utils.rule_matcher import PatternMatcher, build_matchers
+from utils.series_index import DEFAULT_THRESHOLD, SeriesIndex, SeriesMatch
+from utils.title_cache import rules_fingerprint
+
+__all__ = ['RuleEngine', 'current', 'reload_if_changed']
+
+
+class RuleEngine:
+    """mapping_config モジュール 1 版ぶんのコンパイル済みルール。"""
+
+    def __init__(self, cfg):
+        self.pattern_mapping = getattr(cfg, 'PATTERN_MAPPING', {})
+        self.prefix_mapping  = getattr(cfg, 'PREFIX_MAPPING', {})
+        self.series_mapping  = getattr(cfg, 'SERIES_MAPPING', {})
+        self.series_index = SeriesIndex(self.series_mapping,
+                                        getattr(cfg, 'SERIES_FUZZY_THRESHOLD', DEFAULT_THRESHOLD))
+        self.matchers: Dict[str, PatternMatcher] = build_matchers(self.pattern_mapping)
+        self.clips: Dict[str, Tuple[re.Pattern, object]] = {
+            kind: (re.compile(pattern), grp)
+            for kind, (pattern, grp) in getattr(cfg, 'CLIP_REGEX', {}).items()
+        }
+        self.fingerprint = rules_fingerprint(cfg)
+
+    def tag(self, kind: str, default: Optional[str] = 'def') -> Optional[str]:
+        """先頭に付与するタグ（PREFIX_MAPPING に無ければ default）。"""
+        return self.prefix_mapping.get(kind, default)
+
+    def series(self, series_raw: str, kind: str = '', stats=None) -> str:
+        """シリーズ名の短縮形（未登録ならそのまま）。stats には完全一致以外の一致を記録する。"""
+        return self.series_match(series_raw, kind, stats).short
+
+    def series_match(self, series_raw: str, kind: str = '', stats=None) -> SeriesMatch:
+        """series と同じ検索で、一致の方法・確信度まで返す。"""
+        match = self.series_index.lookup(series_raw)
+        if stats is not None and match.method in ('normalized', 'fuzzy'):
+            stats.series(kind, series_raw, match)
+        return match
+
+    def iter_matches(self, kind: str, name: str, stats=None):
+        """(フォーマット, マッチ) を PATTERN_MAPPING の定義順で返す。
+
+        stats（ConversionStats）を渡すと、評価したルールとヒットの有無を記録する。
+        """
+        matcher = self.matchers.get(kind)
+        if matcher is None:
+            return ()
+        if stats is None:
+            return matcher.iter_matches(name)
+        return self._iter_counted(kind, matcher, name, stats)
+
+    @staticmethod
+    def _iter_counted(kind: str, matcher: PatternMatcher, name: str, stats):
+        for i in matcher.candidates(name):
+            pattern, fmt = matcher.rules[i]
+            m = pattern.search(name)
+            stats.rule(kind, i, m is not None)
+            if m:
+                yield fmt, m
+
+    def first_mapping(self, kind: str, name: str, stats=None) -> Optional[str]:
+        """最初にフォーマットできたルールの結果（無ければ None）。"""
+        for fmt, m in self.iter_matches(kind, name, stats):
+            try:
+                return fmt.format(*m.groups())
+            except IndexError:
+                continue
+        return None
+
+    def clip(self, kind: str, name: str, stats=None) -> Optional[str]:
+        """CLIP_REGEX で切り出した部分（種別が無い / マッチしなければ None）。"""
+        entry = self.clips.get(kind)
+        if entry is None:
+            return None
+        if stats is not None:
+            stats.clip_eval(kind)
+        pattern, grp = entry
+        m = pattern.search(name)
+        return m.group(grp) if m else None
+
+
+# --- 共有インスタンスと変更検知 ---------------------------------------------
+
+_lock = threading.Lock()
+_engine: Optional[RuleEngine] = None
+_stamps: Dict[str, Tuple[Tuple[int, int], str]] = {}     # モジュール名 → ((mtime_ns, size), sha256)
+
+
+def _source_changed(module) -> bool:
+    """前回見たときからソースファイルの中身が変わったか。初回は False を返して記録だけする。"""
+    path = getattr(module, '__file__', None)
+    if not path or not os.path.exists(path):
+        return False
+    st = os.stat(path)
+    stat_key = (st.st_mtime_ns, st.st_size)
+    seen = _stamps.get(module.__name__)
+    if seen is not None and seen[0] == stat_key:
+        return False
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _stamps[module.__name__] = (stat_key, digest)
+    return seen is not None and seen[1] != digest
+
+
+def reload_if_changed(*modules) -> bool:
+    """ソースが変わったモジュールだけ reload する（引数は依存される側から順に渡す）。
+
+    あるモジュールを reload したら、後ろに続くモジュールも古い参照を持っているので
+    まとめて reload する。1 つでも reload したら True。
+    """
+    reloaded = False
+    for module in modules:
+        changed = _source_changed(module)
+        if reloaded or changed:
+            importlib.reload(module)
+            _source_changed(module)
+            reloaded = True
+    return reloaded
+
+
+# --- コンパイル済みルールの保存 -----------------------------------------------
+
+COMPILED_PREFIX = 'compiled_rules.'
+# これらのソースが変わったら保存済みのエンジンは使わない（クラス定義・コンパイル方法が変わるため）
+_ENGINE_SOURCES = ('rule_engine', 'rule_matcher', 'series_index', 'title_cache')
+_engine_digest: Optional[str] = None
+
+
+def _compiled_path(cfg) -> Optional[str]:
+    global _engine_digest
+    seen = _stamps.get(cfg.__name__)
+    path = getattr(cfg, '__file__', None)
+    if seen is None or not path:
+        return None
+    if _engine_digest is None:
+        h = hashlib.sha256(sys.version.encode())
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in _ENGINE_SOURCES:
+            with open(os.path.join(here, f"{name}.py"), 'rb') as f:
+                h.update(f.read())
+        _engine_digest = h.hexdigest()
+    digest = hashlib.sha256((seen[1] + _engine_digest).encode()).hexdigest()[:16]
+    return os.path.join(os.path.dirname(os.path.abspath(path)), '__pycache__', f"{COMPILED_PREFIX}{digest}.pickle")
+
+
+def _load_or_build(cfg) -> RuleEngine:
+    path = _compiled_path(cfg)
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                engine = pickle.load(f)
+            if isinstance(engine, RuleEngine) and engine.fingerprint == rules_fingerprint(cfg):
+                return engine
+        except Exception:               # 壊れている・古い形式なら作り直す
+            pass
+
+    engine = RuleEngine(cfg)
+    if path:
+        try:
+            cache_dir = os.path.dirname(path)
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                pickle.dump(engine, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+            for old in os.listdir(cache_dir):       # 古い版は消す
+                if old.startswith(COMPILED_PREFIX) and old != os.path.basename(path):
+                    os.remove(os.path.join(cache_dir, old))
+        except OSError:                 # 書けない場所なら保存しないだけ
+            pass
+    return engine
+
+
+def current() -> RuleEngine:
+    """最新の mapping_config に対応する共有 RuleEngine を返す。"""
+    global _engine
+    with _lock:
+        cfg = sys.modules.get(map_cfg.__name__, map_cfg)
+        if reload_if_changed(cfg) or _engine is None:
+            _engine = _load_or_build(sys.modules.get(map_cfg.__name__, cfg))
+        return _engine
@@ -0,0 +1,171 @@
+"""utils/rule_matcher.py
+
+PATTERN_MAPPING 用のコンパイル済みマッチャー。
+
+- 各パターンから「必ず含まれる固定文字列（キーワード）」を抜き出す
+  例: `^.*COMIC HOTMILK (\\d+)-(\\d+).*` → "COMIC HOTMILK "
+- 全キーワードを 1 本の Aho-Corasick オートマトンにまとめ、名称を 1 回走査して
+  候補ルールだけを絞り込んでから正規表現を評価する
+- 候補は元の定義順で評価するため、最初にヒットしたルールが勝つ挙動は従来どおり
+
+pyahocorasick が入っていれば C 実装を、無ければ純 Python 実装を使う。
+"""
+
+import re
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+try:
+    from re import _parser as sre_parse      # Python 3.11+
+except ImportError:                          # pragma: no cover
+    import sre_parse                         # type: ignore
+
+try:
+    import ahocorasick                       # optional (pyahocorasick)
+except ImportError:
+    ahocorasick = None
+
+__all__ = ['KeywordAutomaton', 'PatternMatcher', 'build_matchers', 'required_literal']
+
+
+def _literal_runs(items, runs: List[str], current: List[str]) -> None:
+    """パース結果を先頭から辿り、途切れずに続く LITERAL の並びを集める。"""
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            current.append(chr(av))
+        elif op is sre_parse.AT:
+            continue                         # ^ / $ などの幅ゼロ要素
+        elif op is sre_parse.SUBPATTERN:
+            _literal_runs(av[-1], runs, current)
+        else:
+            if current:
+                runs.append(''.join(current))
+                current.clear()
+
+
+def required_literal(pattern: str) -> str:
+    """パターンが必ず含む最長の固定文字列を返す（取れなければ空文字）。"""
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return ''
+    runs: List[str] = []
+    current: List[str] = []
+    _literal_runs(parsed, runs, current)
+    if current:
+        runs.append(''.join(current))
+    return max(runs, key=len, default='').casefold()
+
+
+class KeywordAutomaton:
+    """複数キーワードを 1 回の走査で検出する Aho-Corasick オートマトン。
+
+    find() は入力中に現れたキーワードの番号集合を返す。
+    大文字小文字は casefold で吸収する（候補の絞り込み用なので広めで良い）。
+    """
+
+    def __init__(self, keywords: Sequence[str]):
+        self.keywords = list(keywords)
+        if ahocorasick is not None:
+            self._ac = ahocorasick.Automaton()
+            for idx, kw in enumerate(self.keywords):
+                self._ac.add_word(kw, idx)
+            if self.keywords:
+                self._ac.make_automaton()
+            return
+        self._ac = None
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[Set[int]] = [set()]
+        for idx, kw in enumerate(self.keywords):
+            state = 0
+            for ch in kw:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._out.append(set())
+                state = nxt
+            self._out[state].add(idx)
+
+        # 失敗リンクを幅優先で張る
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+        self._out_frozen = [frozenset(o) for o in self._out]
+
+    def find(self, text: str) -> Set[int]:
+        if not self.keywords:
+            return set()
+        text = text.casefold()
+        if self._ac is not None:
+            return {idx for _, idx in self._ac.iter(text)}
+        goto, fail, out = self._goto, self._fail, self._out_frozen
+        hits: Set[int] = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                hits |= out[state]
+        return hits
+
+
+class PatternMatcher:
+    """1 種別分の PATTERN_MAPPING をコンパイルして保持する。"""
+
+    def __init__(self, rules: Sequence[Tuple[str, str]]):
+        self.rules: List[Tuple[re.Pattern, str]] = [(re.compile(p), fmt) for p, fmt in rules]
+        self.literals: List[str] = [required_literal(p) for p, _ in rules]
+
+        # キーワード → ルール番号（同じキーワードを持つルールはまとめる）
+        keywords: List[str] = []
+        self._kw_rules: List[List[int]] = []
+        self._always: List[int] = []          # キーワードが取れなかったルール
+        seen: Dict[str, int] = {}
+        for i, lit in enumerate(self.literals):
+            if not lit:
+                self._always.append(i)
+                continue
+            if lit not in seen:
+                seen[lit] = len(keywords)
+                keywords.append(lit)
+                self._kw_rules.append([])
+            self._kw_rules[seen[lit]].append(i)
+        self.automaton = KeywordAutomaton(keywords)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def candidates(self, name: str) -> List[int]:
+        """キーワードが現れたルールの番号を定義順で返す。"""
+        found = self.automaton.find(name)
+        if not found and not self._always:
+            return []
+        idxs = list(self._always)
+        for kw in found:
+            idxs.extend(self._kw_rules[kw])
+        idxs.sort()
+        return idxs
+
+    def iter_matches(self, name: str) -> Iterator[Tuple[str, 're.Match']]:
+        """候補ルールを定義順に評価し、ヒットしたものを (fmt, match) で返す。"""
+        for i in self.candidates(name):
+            pattern, fmt = self.rules[i]
+            m = pattern.search(name)
+            if m:
+                yield fmt, m
+
+
+def build_matchers(pattern_mapping: Optional[dict]) -> Dict[str, PatternMatcher]:
+    """PATTERN_MAPPING 全体を種別ごとの PatternMatcher に変換する。"""
+    return {kind: PatternMatcher(rules) for kind, rules in (pattern_mapping or {}).items()}
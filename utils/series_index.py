@@ -0,0 +1,159 @@
+"""utils/series_index.py
+
+SERIES_MAPPING（シリーズ名 → 短縮名）の検索インデックス。
+
+検索順:
+1. 完全一致        : SERIES_MAPPING のキーそのまま（従来どおり）
+2. 正規化キー一致  : 全角/半角・ダッシュ類・空白・大文字小文字の揺れを吸収したキーで O(1) 参照
+                     （NFKC の後で、カナ語の中の長音は残す。長音違いの別の文字列は同じキーにしない）
+3. あいまい一致    : threshold を指定したときだけ（既定は無効）。正規化キーの文字 bigram の
+                     転置インデックスから、bigram を共有するキーだけを候補にして Dice 係数を計算し、
+                     threshold 以上で最も高いものを採用
+                     （全キーを走査しない。英数字の並びが違うものは続編・別作品とみなして除外）
+
+lookup() は SeriesMatch（短縮名・一致したキー・方法・確信度）を返す。
+あいまい一致は別作品を拾うことがある（「アイドルマスター シンデレラガールズ劇場」→ デレマス 0.89）ので、
+unknown_label() で未登録シリーズのログにもキーと確信度付きで載せ、人が確認できるようにする。
+"""
+
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+__all__ = ['SeriesIndex', 'SeriesMatch', 'normalize_series', 'unknown_label', 'DEFAULT_THRESHOLD']
+
+DEFAULT_THRESHOLD = None     # あいまい一致は既定で無効（0.85 前後を指定すると有効）
+_MEMO_LIMIT = 100_000
+_ASCII_RUN_RE = re.compile(r'[0-9a-z]+')
+
+
+_DASHES = '-‐‑‒–—―−－'        # NFKC 後に残るハイフン・ダッシュ類（－ は NFKC で - になる）
+_CHOON = 'ー'
+
+
+def _is_kana(c: str) -> bool:
+    return '\u3041' <= c <= '\u30ff' or '\u31f0' <= c <= '\u31ff'
+
+
+def normalize_series(s: str) -> str:
+    # ① 先に NFKC（半角カナ ﾌﾞﾙｰ → ブルー、全角英数・全角空白 → 半角）
+    s = unicodedata.normalize('NFKC', s)
+    # ② 長音・ダッシュ類: カナの後ろの長音（と、カナに挟まれたダッシュ）は長音「ー」のまま残し、
+    #    それ以外（英数字・漢字の間や前後の空白の隣）は単語区切りの空白にする
+    out = []
+    for i, c in enumerate(s):
+        if c == _CHOON or c in _DASHES:
+            prev = s[i - 1] if i else ''
+            nxt = s[i + 1] if i + 1 < len(s) else ''
+            if _is_kana(prev) and (c == _CHOON or _is_kana(nxt)):
+                c = _CHOON
+            else:
+                c = ' '
+        out.append(c)
+    # ③ 連続空白 → 1 個
+    return re.sub(r'\s+', ' ', ''.join(out)).strip()
+
+
+def _key(s: str) -> str:
+    """索引用のキー（normalize_series + 空白除去 + casefold）。"""
+    return normalize_series(s).replace(' ', '').casefold()
+
+
+def _bigrams(key: str) -> set:
+    padded = f"\x02{key}\x03"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+@dataclass(frozen=True)
+class SeriesMatch:
+    short: str                 # 短縮名（見つからなければ入力そのまま）
+    key: Optional[str]         # 一致した SERIES_MAPPING のキー
+    method: Optional[str]      # 'exact' / 'normalized' / 'fuzzy' / None（未登録）
+    confidence: float          # exact / normalized は 1.0、fuzzy は Dice 係数、未登録は 0.0
+
+    @property
+    def found(self) -> bool:
+        return self.method is not None
+
+
+def unknown_label(series_raw: str, match: SeriesMatch) -> Optional[str]:
+    """未登録シリーズのログに載せる文字列（載せないなら None）。
+
+    未登録ならシリーズ名そのまま、あいまい一致なら「名前<TAB>≈ 一致したキー (確信度)」。
+    """
+    if match.method == 'fuzzy':
+        return f"{series_raw}\t≈ {match.key} ({match.confidence:.2f})"
+    return series_raw if series_raw == match.short else None
+
+
+class SeriesIndex:
+    """SERIES_MAPPING から一度だけ作る検索インデックス。"""
+
+    def __init__(self, mapping: Dict[str, str], threshold: Optional[float] = DEFAULT_THRESHOLD):
+        self.mapping = dict(mapping)
+        self.threshold = threshold
+        self._by_key: Dict[str, str] = {}              # 正規化キー → 元のキー（先勝ち）
+        for raw in self.mapping:
+            self._by_key.setdefault(_key(raw), raw)
+
+        self._keys: List[str] = list(self._by_key)
+        self._grams: List[int] = []
+        self._postings: Dict[str, List[int]] = {}
+        for i, key in enumerate(self._keys):
+            grams = _bigrams(key)
+            self._grams.append(len(grams))
+            for g in grams:
+                self._postings.setdefault(g, []).append(i)
+        self._memo: Dict[str, SeriesMatch] = {}
+
+    def __len__(self) -> int:
+        return len(self.mapping)
+
+    def lookup(self, series_raw: str) -> SeriesMatch:
+        hit = self._memo.get(series_raw)
+        if hit is None:
+            if len(self._memo) >= _MEMO_LIMIT:
+                self._memo.clear()
+            hit = self._memo[series_raw] = self._lookup(series_raw)
+        return hit
+
+    def short(self, series_raw: str) -> str:
+        return self.lookup(series_raw).short
+
+    def _lookup(self, series_raw: str) -> SeriesMatch:
+        short = self.mapping.get(series_raw)
+        if short is not None:
+            return SeriesMatch(short, series_raw, 'exact', 1.0)
+        if not series_raw:
+            return SeriesMatch(series_raw, None, None, 0.0)
+
+        key = _key(series_raw)
+        raw = self._by_key.get(key)
+        if raw is not None:
+            return SeriesMatch(self.mapping[raw], raw, 'normalized', 1.0)
+
+        if self.threshold is not None and key:
+            best = self._fuzzy(key)
+            if best is not None:
+                raw = self._by_key[self._keys[best[0]]]
+                return SeriesMatch(self.mapping[raw], raw, 'fuzzy', round(best[1], 4))
+        return SeriesMatch(series_raw, None, None, 0.0)
+
+    def _fuzzy(self, key: str):
+        grams = _bigrams(key)
+        shared: Dict[int, int] = {}
+        for g in grams:
+            for i in self._postings.get(g, ()):
+                shared[i] = shared.get(i, 0) + 1
+
+        n, threshold, best = len(grams), self.threshold, None
+        runs = _ASCII_RUN_RE.findall(key)
+        for i, common in shared.items():
+            score = 2 * common / (n + self._grams[i])
+            if score < threshold or (best is not None and (score, -i) <= (best[1], -best[0])):
+                continue
+            if _ASCII_RUN_RE.findall(self._keys[i]) != runs:
+                continue                     # 「XI」と「X」など、英数字が違うものは別物
+            best = (i, score)
+        return best
@@ -0,0 +1,310 @@
+"""utils/shadow_run.py
+
+シャドー実行: 現行の変換（行ごとの convert_one / format_title）と候補エンジンを同じ入力で走らせ、
+変換後が 1 文字も違わないことを確かめる。リポジトリ直下で実行する:
+
+    python -m utils.shadow_run                                   # bench_fixtures の固定 seed コーパス
+    python -m utils.shadow_run history/ --candidate workers
+    python -m utils.shadow_run history/rename_2024.tsv --target format_title --candidate batch
+
+- 行ごとに変換後（日付展開後）と未登録シリーズを比べ、違った行を 種別 × ルールでまとめる
+  （ルールは現行側がたどった分岐: PATTERN_MAPPING の番号 rule:N / clip / default / 種別固有の分岐名）
+- 速度比（現行の秒数 / 候補の秒数）とメモリ比（tracemalloc のピーク、候補 / 現行）。
+  workers 系はワーカープロセス内の確保を含まない
+- 差分があれば終了コード 1
+
+assert_equivalent() は差分があると AssertionError を投げるので、pytest からはコーパスを
+パラメータにして呼ぶだけでよい。ブロック側は shadow="vectorized" などで同じ比較を行う
+（出力には影響しない）。
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+import utils.title_normalizer as tn
+from utils import rule_engine
+from utils.title_formatter import format_title, format_titles
+
+__all__ = ['ENGINES', 'REFERENCE', 'ShadowReport', 'shadow_compare', 'assert_equivalent', 'load_corpus']
+
+REFERENCE = 'rows'
+
+# (種別列, 名称列, 日時) → (変換後, 未登録シリーズ or None)
+Engine = Callable[[pd.Series, pd.Series, datetime], Tuple[pd.Series, Optional[pd.Series]]]
+
+
+def _titles(convert_many) -> Engine:
+    def run(kinds, names, now):
+        templates, unknown = convert_many(kinds, names)
+        return tn.render_templates(templates, now), unknown
+    return run
+
+
+def _format_rows(kinds, names, now):
+    return pd.Series([format_title(k, n) for k, n in zip(kinds, names)], index=names.index, dtype=object), None
+
+
+def _format_batch(kinds, names, now):
+    return format_titles(kinds, names), None
+
+
+_WORKERS = max(2, min(4, os.cpu_count() or 1))
+
+ENGINES: Dict[str, Dict[str, Engine]] = {
+    'normalize_titles': {
+        'rows': _titles(tn.convert_rows),
+        'vectorized': _titles(tn.convert_vectorized),
+        'workers': _titles(partial(tn.convert_parallel, workers=_WORKERS)),
+        'workers_vectorized': _titles(partial(tn.convert_parallel, workers=_WORKERS, vectorized=True)),
+    },
+    'format_title': {
+        'rows': _format_rows,
+        'batch': _format_batch,
+    },
+}
+
+# 種別固有の分岐（PATTERN_MAPPING を通らないもの）の名前
+_TITLE_BRANCHES = {
+    'その他': 'tag', '小説': 'tag', '美術': 'art', 'コミック': 'comic',
+    '成年コミック': 'seinen', '電子成年コミック': 'seinen', '同人': 'doujin', '電子同人': 'doujin',
+}
+_FORMAT_BRANCHES = {'コミック': 'comic', 'CG': 'comic', '成年': 'seinen'}
+
+
+def rule_label(target: str, kind: str, name: str, rules=None) -> str:
+    """現行の変換がその行でたどる分岐（差分の集計キー）。"""
+    rules = rules or rule_engine.current()
+    if target == 'normalize_titles':
+        if rules.tag(kind) == 'def':
+            return 'def'
+        branch = _TITLE_BRANCHES.get(kind)
+    else:
+        branch = _FORMAT_BRANCHES.get(kind)
+    if branch:
+        return branch
+    matcher = rules.matchers.get(kind)
+    if matcher is not None:
+        for i in matcher.candidates(name):
+            pattern, fmt = matcher.rules[i]
+            m = pattern.search(name)
+            if m is None:
+                continue
+            try:
+                fmt.format(*m.groups())
+            except IndexError:
+                continue
+            return f"rule:{i}"
+    return 'clip' if rules.clip(kind, name) is not None else 'default'
+
+
+@dataclass
+class ShadowReport:
+    target: str
+    candidate: str
+    rows: int
+    kind_rows: Dict[str, int]
+    diffs: pd.DataFrame                 # 行, 種別, 名称, rule, expected, actual, expected_unknown, actual_unknown
+    ref_seconds: float
+    cand_seconds: float
+    ref_peak_bytes: Optional[int] = None
+    cand_peak_bytes: Optional[int] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.diffs.empty
+
+    @property
+    def speedup(self) -> Optional[float]:
+        return self.ref_seconds / self.cand_seconds if self.cand_seconds else None
+
+    @property
+    def memory_ratio(self) -> Optional[float]:
+        if not self.ref_peak_bytes or self.cand_peak_bytes is None:
+            return None
+        return self.cand_peak_bytes / self.ref_peak_bytes
+
+    def by_kind(self) -> pd.DataFrame:
+        counts = self.diffs.groupby('種別').size() if not self.ok else pd.Series(dtype=int)
+        return pd.DataFrame({
+            '種別': list(self.kind_rows),
+            'rows': list(self.kind_rows.values()),
+            'diffs': [int(counts.get(k, 0)) for k in self.kind_rows],
+        }).sort_values(['diffs', 'rows'], ascending=False, ignore_index=True)
+
+    def by_rule(self) -> pd.DataFrame:
+        if self.ok:
+            return pd.DataFrame(columns=['種別', 'rule', 'diffs', 'example'])
+        grouped = self.diffs.groupby(['種別', 'rule'], sort=False)
+        out = grouped.size().rename('diffs').reset_index()
+        out['example'] = grouped['名称'].first().to_numpy()
+        return out.sort_values('diffs', ascending=False, ignore_index=True)
+
+    def summary(self) -> str:
+        lines = [f"[SHADOW] {self.target}: {REFERENCE} vs {self.candidate} / {self.rows} 行 / "
+                 f"差分 {len(self.diffs)} 行"]
+        speed = f"{self.speedup:.2f}x" if self.speedup else '-'
+        memory = f"{self.memory_ratio:.2f}x" if self.memory_ratio is not None else '-'
+        lines.append(f"[SHADOW] 時間 {self.ref_seconds:.3f}s → {self.cand_seconds:.3f}s（速度 {speed}）"
+                     f" / メモリピーク比 {memory}")
+        for r in self.by_rule().head(10).itertuples(index=False):
+            lines.append(f"[SHADOW]   {r[0]} / {r[1]}: {r[2]} 行（例: {r[3]}）")
+        return '\n'.join(lines)
+
+    def save(self, log_dir: str) -> Optional[str]:
+        """差分があれば log_dir/shadow_diff_<日時>.tsv に書き出してパスを返す。"""
+        if self.ok:
+            return None
+        os.makedirs(log_dir or '.', exist_ok=True)
+        ts = datetime.now().strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(log_dir or '.', f"shadow_diff_{ts}.tsv")
+        self.diffs.to_csv(path, sep='\t', index=False, encoding='utf-8')
+        return path
+
+
+def _run(engine: Engine, kinds, names, now, memory: bool):
+    """(結果, 秒数, ピークバイト数 or None)。メモリは時間を汚さないよう別に 1 回流して測る。"""
+    t0 = time.perf_counter()
+    result = engine(kinds, names, now)
+    seconds = time.perf_counter() - t0
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            engine(kinds, names, now)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def _same(a: pd.Series, b: pd.Series):
+    """要素ごとの一致（None / NaN 同士は一致）。"""
+    a = a.astype(object).where(a.notna(), None)
+    b = b.astype(object).where(b.notna(), None)
+    return pd.Series([x == y for x, y in zip(a, b)], index=a.index, dtype=bool), a, b
+
+
+def shadow_compare(kinds: pd.Series, names: pd.Series, candidate='vectorized',
+                   target: str = 'normalize_titles', memory: bool = True,
+                   now: Optional[datetime] = None) -> ShadowReport:
+    """現行（ENGINES[target]['rows']）と candidate を同じ (種別, 名称) で実行して比べる。
+
+    candidate は ENGINES[target] の名前か、Engine と同じ形の関数。
+    kinds / names は key_columns() 済み（strip 済み）のものを渡す。
+    """
+    engines = ENGINES[target]
+    if isinstance(candidate, str):
+        if candidate not in engines:
+            raise ValueError(f"candidate は {', '.join(engines)} のいずれかです: {candidate!r}")
+        cand_name, cand = candidate, engines[candidate]
+    else:
+        cand_name, cand = getattr(candidate, '__name__', 'candidate'), candidate
+    now = now or datetime.now()
+    rules = rule_engine.current()           # コンパイルは計測に含めない
+
+    (expected, exp_unk), ref_s, ref_peak = _run(engines[REFERENCE], kinds, names, now, memory)
+    (actual, act_unk), cand_s, cand_peak = _run(cand, kinds, names, now, memory)
+    if len(actual) != len(expected):
+        raise AssertionError(f"{cand_name}: 行数が違います（{len(expected)} → {len(actual)}）")
+
+    actual = pd.Series(list(actual), index=expected.index, dtype=object)
+    same, expected, actual = _same(expected, actual)
+    if exp_unk is None and act_unk is None:
+        exp_unk = act_unk = pd.Series(None, index=expected.index, dtype=object)
+    else:
+        blank = pd.Series(None, index=expected.index, dtype=object)
+        exp_unk = blank if exp_unk is None else pd.Series(list(exp_unk), index=expected.index, dtype=object)
+        act_unk = blank if act_unk is None else pd.Series(list(act_unk), index=expected.index, dtype=object)
+    same_unk, exp_unk, act_unk = _same(exp_unk, act_unk)
+    bad = (~(same & same_unk)).to_numpy()
+
+    diff_kinds = kinds[bad].tolist()
+    diff_names = names[bad].tolist()
+    diffs = pd.DataFrame({
+        '行': [int(i) for i in bad.nonzero()[0]],
+        '種別': diff_kinds,
+        '名称': diff_names,
+        'rule': [rule_label(target, k, n, rules) for k, n in zip(diff_kinds, diff_names)],
+        'expected': expected[bad].tolist(),
+        'actual': actual[bad].tolist(),
+        'expected_unknown': exp_unk[bad].tolist(),
+        'actual_unknown': act_unk[bad].tolist(),
+    })
+    kind_rows = {str(k): int(n) for k, n in kinds.value_counts(sort=False).items()}
+    return ShadowReport(target, cand_name, len(kinds), kind_rows, diffs, ref_s, cand_s, ref_peak, cand_peak)
+
+
+def assert_equivalent(kinds: pd.Series, names: pd.Series, candidate='vectorized',
+                      target: str = 'normalize_titles', **kwargs) -> ShadowReport:
+    """shadow_compare して差分があれば AssertionError（メッセージは summary()）。"""
+    report = shadow_compare(kinds, names, candidate, target, **kwargs)
+    if not report.ok:
+        raise AssertionError(report.summary())
+    return report
+
+
+def load_corpus(paths: Sequence[str]) -> List[Tuple[str, pd.DataFrame]]:
+    """ファイル / ディレクトリ（配下の *.tsv）を読み込み、(パス, DataFrame) のリストにする。"""
+    from utils.tsv_loader import read_tsv
+
+    files: List[Path] = []
+    for p in map(Path, paths):
+        files.extend(sorted(p.rglob('*.tsv')) if p.is_dir() else [p])
+    corpus = []
+    for path in files:
+        df, _ = read_tsv(str(path))
+        if {'種別', '名称'} - set(df.columns):
+            print(f"[SHADOW] 種別 / 名称 列が無いので飛ばします: {path}")
+            continue
+        corpus.append((str(path), df))
+    return corpus
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog='python -m utils.shadow_run', description=__doc__.split('\n\n')[0])
+    ap.add_argument('paths', nargs='*', help='rename.tsv かそれを含むディレクトリ（省略時は固定 seed で生成）')
+    ap.add_argument('--target', choices=list(ENGINES), default='normalize_titles')
+    ap.add_argument('--candidate', default=None, help='候補エンジン（既定は target の 2 番目）')
+    ap.add_argument('--rows', type=int, default=20_000, help='生成コーパスの行数')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--no-memory', action='store_true', help='メモリを測らない（実行は 1 回ずつ）')
+    ap.add_argument('--diff-dir', help='差分 TSV の書き出し先')
+    args = ap.parse_args(argv)
+    candidate = args.candidate or list(ENGINES[args.target])[1]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.paths:
+            corpus = load_corpus(args.paths)
+        else:
+            from utils.bench_fixtures import make_rename_tsv
+            path = os.path.join(tmp, f"rename_seed{args.seed}.tsv")
+            make_rename_tsv(path, args.rows, seed=args.seed)
+            corpus = load_corpus([path])
+
+        failed = 0
+        for path, df in corpus:
+            kinds, names = tn.key_columns(df)
+            report = shadow_compare(kinds, names, candidate, args.target, memory=not args.no_memory)
+            print(f"[SHADOW] {path}")
+            print(report.summary())
+            if not report.ok:
+                failed += 1
+                # 生成コーパスは一時ディレクトリにあるので、差分はカレントに書く
+                saved = report.save(args.diff_dir or (os.path.dirname(os.path.abspath(path)) if args.paths else '.'))
+                print(f"[SHADOW] 差分 → {saved}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""utils/title_cache.py
+
+タイトル変換結果の永続キャッシュ（SQLite）。
+
+- キーは (名前空間, 種別, 名称)。名前空間は呼び出し元（normalize_titles / format_title）ごと
+- mapping_config のルール（PATTERN_MAPPING / CLIP_REGEX / PREFIX_MAPPING / SERIES_MAPPING など）の
+  ハッシュを名前空間ごとに記録し、変わっていたらその名前空間を丸ごと破棄する
+- 件数上限を超えたら最終利用が古いものから削除（LRU）。件数はオープン時に 1 回数えて以後は
+  手元で増減させる（put のたびに COUNT(*) しない）
+- 1 件ずつの get は索引を直接引く。1 件ずつの put と最終利用の更新は溜めておき、BATCH 件ごと・
+  put_many / get_many・close 時にまとめて書く（close しないと最後の BATCH 件未満は残らない）
+- 日付入りの出力はテンプレート（YMD / YYMMDD トークン入り）で保存し、
+  取り出すときに render_template() で当日の日付へ展開する
+- トークンは私用領域の文字で、cp932 の外字（F040 / F041 …）をデコードした名称にも現れうる。
+  名称由来のトークン文字は convert_masked() で ESC を前置したテンプレートにし、
+  render_template() は ESC の付いた文字を日付にせずそのまま残す
+- 同じファイルを複数の接続（常駐モードで並列に走るジョブなど）が開いてもよい。
+  ほかの接続が書き込み中なら BUSY_TIMEOUT 秒まで待つ
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+__all__ = ['TitleCache', 'rules_fingerprint', 'render_template', 'has_markers', 'convert_masked',
+           'YMD', 'YYMMDD', 'ESC']
+
+# テンプレート用トークン（私用領域の文字。名称に同じ文字があれば convert_masked で区別する）
+YMD    = '\ue000'     # → %Y%m%d
+YYMMDD = '\ue001'     # → %y%m%d
+ESC    = '\ue002'     # 直後の 1 文字は名称由来（日付にしない）
+
+_MARKERS = (YMD, YYMMDD, ESC)
+_TOKEN_RE = re.compile(f"{ESC}(.)|[{YMD}{YYMMDD}]", re.S)
+# 変換中だけ名称中のトークン文字の代わりに使う文字（Unicode の非文字。テキストには現れない）
+_SPARE = tuple(chr(c) for c in range(0xFDD0, 0xFDF0))
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+BATCH = 1_000              # put / get で溜める登録・最終利用の更新の上限（超えたら書き込む）
+CACHE_FILENAME = '.title_cache.sqlite'
+BUSY_TIMEOUT = 30.0        # ほかの接続の書き込みを待つ秒数（sqlite3 の既定は 5 秒）
+
+Key = Tuple[str, str]                 # (種別, 名称)
+Value = Tuple[str, Optional[str]]     # (テンプレート, 未登録シリーズ or None)
+
+
+def render_template(template: str, now: Optional[datetime] = None) -> str:
+    """テンプレート中の日付トークンを展開する（ESC 付きの文字は元の文字に戻す）。"""
+    if not has_markers(template):
+        return template
+    now = now or datetime.today()
+    ymd, yymmdd = now.strftime('%Y%m%d'), now.strftime('%y%m%d')
+    if ESC not in template:
+        return template.replace(YMD, ymd).replace(YYMMDD, yymmdd)
+    return _TOKEN_RE.sub(lambda m: m.group(1) or (ymd if m.group(0) == YMD else yymmdd), template)
+
+
+def has_markers(name: str) -> bool:
+    return YMD in name or YYMMDD in name or ESC in name
+
+
+def convert_masked(convert: Callable[[str], Tuple[str, Optional[str]]], name: str):
+    """名称にトークンと同じ文字があるときの変換。convert は (テンプレート, 未登録シリーズ) を返す関数。
+
+    名称中のトークン文字を名称に無い非文字へ置き換えて変換し、テンプレートでは ESC + 元の文字、
+    未登録シリーズでは元の文字に戻す（1 文字を 1 文字に置き換えるのでルールの当たり方は変わらない）。
+    """
+    spare = [c for c in _SPARE if c not in name][:len(_MARKERS)]
+    masks = dict(zip(_MARKERS, spare))
+    template, unknown = convert(name.translate(str.maketrans(masks)))
+    template = template.translate({ord(s): ESC + m for m, s in masks.items()})
+    if unknown is not None:
+        unknown = unknown.translate({ord(s): m for m, s in masks.items()})
+    return template, unknown
+
+
+def rules_fingerprint(map_cfg) -> str:
+    """mapping_config のルール一式から短いハッシュを作る。"""
+    parts = [
+        repr(getattr(map_cfg, 'PATTERN_MAPPING', {})),
+        repr(getattr(map_cfg, 'CLIP_REGEX', {})),
+        repr(getattr(map_cfg, 'PREFIX_MAPPING', {})),
+        repr(getattr(map_cfg, 'SERIES_MAPPING', {})),
+        repr(getattr(map_cfg, 'SERIES_FUZZY_THRESHOLD', None)),
+    ]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+class TitleCache:
+    """(種別, 名称) → 変換テンプレート の SQLite キャッシュ。"""
+
+    def __init__(self, path: str, rules_hash: str, namespace: str,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS entries (
+                ns     TEXT NOT NULL,
+                kind   TEXT NOT NULL,
+                name   TEXT NOT NULL,
+                value  TEXT NOT NULL,
+                series TEXT,
+                used   INTEGER NOT NULL,
+                UNIQUE (ns, kind, name)
+            );
+            CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+        """)
+
+        # ルールが変わっていたらこの名前空間を破棄
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (f'rules:{namespace}',)).fetchone()
+        if row is None or row[0] != rules_hash:
+            self._db.execute('DELETE FROM entries WHERE ns = ?', (namespace,))
+            self._db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (f'rules:{namespace}', rules_hash))
+
+        # LRU 用の論理時計（オープンごとに 1 進める）
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'clock'").fetchone()
+        self._clock = int(row[0]) + 1 if row else 1
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('clock', ?)", (str(self._clock),))
+        self._db.commit()
+
+        self._count = self._db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        self._pending: Dict[Key, Value] = {}    # put で溜めた未書き込みの登録
+        self._touched: list = []                # get で当たった (種別, 名称)。used の更新待ち
+
+    @classmethod
+    def beside(cls, output_path: str, rules_hash: str, namespace: str, **kwargs) -> 'TitleCache':
+        """output_path と同じディレクトリにキャッシュファイルを置く。"""
+        path = os.path.join(os.path.dirname(output_path) or '.', CACHE_FILENAME)
+        return cls(path, rules_hash, namespace, **kwargs)
+
+    # --- 参照 ---
+
+    def get(self, kind: str, name: str) -> Optional[Value]:
+        pending = self._pending.get((kind, name))
+        if pending is not None:
+            self.hits += 1
+            return pending
+        row = self._db.execute(
+            'SELECT value, series, used FROM entries WHERE ns = ? AND kind = ? AND name = ?',
+            (self.namespace, kind, name),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if row[2] != self._clock:
+            self._touched.append((kind, name))
+            if len(self._touched) >= BATCH:
+                self.flush()
+        return row[0], row[1]
+
+    def get_many(self, keys: Iterable[Key]) -> Dict[Key, Value]:
+        self.flush()
+        db = self._db
+        db.execute('CREATE TEMP TABLE IF NOT EXISTS q (kind TEXT, name TEXT)')
+        db.execute('DELETE FROM q')
+        db.executemany('INSERT INTO q VALUES (?, ?)', keys)
+        rows = db.execute(
+            'SELECT q.kind, q.name, e.value, e.series FROM q '
+            'JOIN entries e ON e.ns = ? AND e.kind = q.kind AND e.name = q.name',
+            (self.namespace,),
+        ).fetchall()
+        asked = db.execute('SELECT COUNT(*) FROM q').fetchone()[0]
+        if rows:
+            db.execute(
+                'UPDATE entries SET used = ? WHERE ns = ? AND (kind, name) IN (SELECT kind, name FROM q)',
+                (self._clock, self.namespace),
+            )
+        db.execute('DELETE FROM q')
+        db.commit()
+        self.hits += len(rows)
+        self.misses += asked - len(rows)
+        return {(k, n): (v, s) for k, n, v, s in rows}
+
+    # --- 登録 ---
+
+    def put(self, kind: str, name: str, value: str, series: Optional[str] = None) -> None:
+        """1 件ずつの登録は溜めておき、BATCH 件ごと（と close 時）にまとめて書く。"""
+        self._pending[(kind, name)] = (value, series)
+        if len(self._pending) >= BATCH:
+            self.flush()
+
+    def put_many(self, items: Dict[Key, Value]) -> None:
+        self._pending.update(items)
+        self.flush()
+
+    def flush(self) -> None:
+        """溜めている登録と最終利用の更新を書き込む。"""
+        if not self._pending and not self._touched:
+            return
+        db = self._db
+        if self._touched:
+            db.executemany(
+                'UPDATE entries SET used = ? WHERE ns = ? AND kind = ? AND name = ?',
+                ((self._clock, self.namespace, k, n) for k, n in self._touched),
+            )
+            self._touched.clear()
+        if self._pending:
+            rows = [(v, s, self._clock, self.namespace, k, n) for (k, n), (v, s) in self._pending.items()]
+            self._pending.clear()
+            before = db.total_changes
+            db.executemany(
+                'INSERT OR IGNORE INTO entries (value, series, used, ns, kind, name) VALUES (?, ?, ?, ?, ?, ?)',
+                rows)
+            added = db.total_changes - before
+            if added < len(rows):       # 既にあったキー（別プロセスが先に入れた等）は上書き
+                db.executemany('UPDATE entries SET value = ?, series = ?, used = ? '
+                               'WHERE ns = ? AND kind = ? AND name = ?', rows)
+            self._count += added
+            self._evict()
+        db.commit()
+
+    def _evict(self) -> None:
+        excess = self._count - self.max_entries
+        if excess > 0:
+            cur = self._db.execute(
+                'DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY used LIMIT ?)',
+                (excess,),
+            )
+            self._count -= cur.rowcount
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
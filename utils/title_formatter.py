@@ -1,6 +1,7 @@
 """utils/title_formatter.py
 
-パイプライン側から `format_title(kind, name)` を呼び出すだけで
+パイプライン側から `format_title(kind, name)`（まとめて変換するなら
+`format_titles(kinds, names)`）を呼び出すだけで
 - コミック / CG            : `[作者]タイトル第N巻`
 - 成年                      : `[作者][出版社][20yymmdd]タイトル`
 - その他                    : PATTERN_MAPPING / CLIP_REGEX / fallback
@@ -8,23 +9,27 @@
 
 依存:
 - utils.comic_parser        : parse_comic_name, format_comic
-- utils.mapping_config      : PATTERN_MAPPING, CLIP_REGEX
+- utils.rule_engine         : PATTERN_MAPPING / CLIP_REGEX のコンパイル済み共有エンジン
 
 これにより **pipeline_transformer.py** は極小の I/O & 日付付与ロジックのみとなり、
 種類別の文字列変換はすべて本モジュール内に集約されます。
 """
 
+import time
 from datetime import datetime
-import re, importlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from utils import rule_engine
 from utils.comic_parser import parse_comic_name, format_comic
-import utils.mapping_config as map_cfg
-importlib.reload(map_cfg)
+from utils.conversion_stats import ConversionStats
+from utils.title_cache import TitleCache, convert_masked, has_markers, render_template, YMD, YYMMDD
 
-PATTERN_MAPPING = getattr(map_cfg, 'PATTERN_MAPPING', {})
-CLIP_REGEX = getattr(map_cfg, 'CLIP_REGEX', {})
-DEFAULT_FILL = datetime.today().strftime('%Y%m%d')
+DEFAULT_FILL = YMD     # 返却直前に当日日付へ展開
+CACHE_NAMESPACE = 'format_title/2'     # 2: 名称由来のトークン文字を ESC 付きで保存
 
-__all__ = ['format_title']
+__all__ = ['format_title', 'format_titles']
 
 # -- 内部ヘルパー --
 
@@ -35,30 +40,112 @@ def _format_seinen(name):
     info = parse_comic_name(name)
     author = info['author'] or ''
     title = info['title'] or name
-    today = datetime.today().strftime('%y%m%d')
+    today = YYMMDD
     return f"[{author}][出版社](20{today}){title}"
 
-def _mapping_lookup(kind, name):
-    for pattern, fmt in PATTERN_MAPPING.get(kind, []):
-        m = re.search(pattern, name)
-        if m:
-            try:
-                return fmt.format(*m.groups())
-            except IndexError:
-                continue
-    if kind in CLIP_REGEX:
-        pat, grp = CLIP_REGEX[kind]
-        m = re.search(pat, name)
-        if m:
-            return m.group(grp)
-    return DEFAULT_FILL
+def _mapping_lookup(kind, name, stats=None, rules=None):
+    rules = rules or rule_engine.current()
+    mapped = rules.first_mapping(kind, name, stats)
+    if mapped is not None:
+        outcome = 'mapping'
+    else:
+        mapped = rules.clip(kind, name, stats)
+        outcome = 'default' if mapped is None else 'clip'
+    if stats is not None:
+        stats.outcome(kind, outcome)
+    return DEFAULT_FILL if mapped is None else mapped
 
-# --- 公開関数 ---
+def _masked(fn, name):
+    """fn(name)。外字などでトークンと同じ文字を含む名称は convert_masked 経由で呼ぶ。"""
+    if has_markers(name):
+        return convert_masked(lambda n: (fn(n), None), name)[0]
+    return fn(name)
 
-def format_title(kind: str, name: str) -> str:
-    kind = kind.strip()
+def _format_template(kind, name, stats=None):
+    if has_markers(name):
+        return _masked(lambda n: _format_template(kind, n, stats), name)
     if kind in {'コミック', 'CG'}:
         return _format_comic_or_cg(name)
     if kind == '成年':
         return _format_seinen(name)
-    return _mapping_lookup(kind, name)
+    return _mapping_lookup(kind, name, stats)
+
+# --- 公開関数 ---
+
+def format_title(kind: str, name: str, cache: Optional[TitleCache] = None,
+                 stats: Optional[ConversionStats] = None) -> str:
+    """cache を渡すと変換前にキャッシュを引き、無ければ変換して登録する。
+
+    キャッシュは `TitleCache(path, rule_engine.current().fingerprint, CACHE_NAMESPACE)` で作り、
+    使い終わったら close する（登録はまとめて書くため）。
+    stats を渡すと、キャッシュに無く実際に変換した分を記録する。
+    """
+    kind = kind.strip()
+    hit = cache.get(kind, name) if cache is not None else None
+    if hit is not None:
+        template = hit[0]
+    else:
+        if stats is None:
+            template = _format_template(kind, name)
+        else:
+            t0 = time.perf_counter_ns()
+            template = _format_template(kind, name, stats)
+            stats.timed(kind, time.perf_counter_ns() - t0)
+        if cache is not None:
+            cache.put(kind, name, template)
+    return render_template(template, datetime.today())
+
+
+def _format_kind_group(kind: str, names: List[str], rules, stats=None) -> List[str]:
+    """1 種別ぶんの名称をまとめてテンプレートにする（分岐の判定は 1 回だけ）。"""
+    if kind in {'コミック', 'CG'}:
+        fn = _format_comic_or_cg
+    elif kind == '成年':
+        fn = _format_seinen
+    else:
+        fn = lambda name: _mapping_lookup(kind, name, stats, rules)
+    if stats is None:
+        return [_masked(fn, name) for name in names]
+    t0 = time.perf_counter_ns()
+    out = [_masked(fn, name) for name in names]
+    stats.timed(kind, time.perf_counter_ns() - t0, len(names))
+    return out
+
+
+def format_titles(kinds: Sequence[str], names: Sequence[str], cache: Optional[TitleCache] = None,
+                  stats: Optional[ConversionStats] = None):
+    """format_title のバッチ版。結果は入力順で、names が Series なら同じ index の Series を返す。
+
+    同じ (種別, 名称) は 1 回だけ変換し、種別ごとにまとめて処理する。
+    日付は呼び出しごとに 1 回だけ求めて展開する。
+    """
+    kind_list = [str(k).strip() for k in kinds]
+    name_list = [str(n) for n in names]
+    if len(kind_list) != len(name_list):
+        raise ValueError('kinds と names の長さが違います')
+
+    unique: Dict[Tuple[str, str], Optional[str]] = dict.fromkeys(zip(kind_list, name_list))
+    if cache is not None:
+        for key, (template, _) in cache.get_many(unique).items():
+            unique[key] = template
+
+    groups: Dict[str, List[str]] = {}
+    for (kind, name), template in unique.items():
+        if template is None:
+            groups.setdefault(kind, []).append(name)
+
+    rules = rule_engine.current()
+    fresh: Dict[Tuple[str, str], str] = {}
+    for kind, group in groups.items():
+        for name, template in zip(group, _format_kind_group(kind, group, rules, stats)):
+            fresh[(kind, name)] = template
+    unique.update(fresh)
+    if cache is not None:
+        cache.put_many({key: (template, None) for key, template in fresh.items()})
+
+    now = datetime.today()
+    rendered = {key: render_template(template, now) for key, template in unique.items()}
+    out = [rendered[key] for key in zip(kind_list, name_list)]
+    if isinstance(names, pd.Series):
+        return pd.Series(out, index=names.index, dtype=object)
+    return out
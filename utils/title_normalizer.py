@@ -0,0 +1,356 @@
+"""utils/title_normalizer.py
+
+rename.tsv の 種別 / 名称 → 変換後 の変換ロジック本体。
+Mage ブロック（transformers/book_title_transformer.py）は I/O とモード切り替えだけを行い、
+変換はすべて本モジュールで行う（ワーカープロセスからも import できるようにするため）。
+
+- convert_one        : 1 行ぶんの変換
+- convert_rows       : 行ごとに convert_one（既定）
+- convert_vectorized : 種別ごとに Series.str で一括変換
+- convert_parallel   : シャードに分けてプロセスプールで変換
+- convert_cached     : TitleCache に無いものだけを変換
+
+戻り値はいずれも (変換後テンプレート, 未登録シリーズ)。テンプレート中の日付トークンは
+render_templates() で展開する。
+
+各関数の stats に ConversionStats を渡すと、種別ごとの件数・時間とルールごとの評価・ヒット数を記録する。
+
+ルール（PATTERN_MAPPING / CLIP_REGEX / PREFIX_MAPPING / SERIES_MAPPING）は
+utils.rule_engine の共有エンジンから一括変換の開始時に 1 回だけ取り出して使う。
+"""
+
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import utils.comic_parser as cp
+from utils import rule_engine
+from utils.comic_parser import format_comic, tokenize, tokenize_clean
+from utils.conversion_stats import ConversionStats
+from utils.rule_engine import RuleEngine
+from utils.series_index import unknown_label
+from utils.title_cache import ESC, TitleCache, YMD, YYMMDD, convert_masked, has_markers, render_template
+
+__all__ = [
+    'convert_one', 'convert_rows', 'convert_vectorized', 'convert_parallel',
+    'convert_cached', 'key_columns', 'render_templates', 'CACHE_NAMESPACE',
+]
+
+DEFAULT_FILL = YMD     # 日付はテンプレートで持ち、書き出し直前に当日日付へ展開する
+CACHE_NAMESPACE = 'normalize_titles/4'     # 2: 名称由来のトークン文字を ESC 付きで保存 / 3: あいまい一致も未登録に
+                                           # 4: シリーズ名の正規化を NFKC 先行・長音保持に変更
+
+_MONTH_RE = re.compile(r'年(\d{1,2})月')
+_DAY_RE   = re.compile(r'-(\d{1,2})')
+
+
+def convert_one(kind: str, name: str, rules: Optional[RuleEngine] = None,
+                stats: Optional[ConversionStats] = None):
+    """1 行ぶんの変換。(変換後テンプレート, 未登録シリーズ or None) を返す。"""
+    rules = rules or rule_engine.current()
+    if has_markers(name):               # 外字などでトークンと同じ文字を含む名称
+        return convert_masked(lambda n: convert_one(kind, n, rules, stats), name)
+    tag   = rules.tag(kind)  # 先頭に付与するタグ（無ければdef）
+
+    # ---（変換せずそのまま出力） ----
+    if tag in {"def"}:
+        return name, None
+    # --- 設定資料 ---------------------------------------
+    if kind in {"その他", "小説"}:
+        return (f"{tag}{name}" if tag else name), None
+    # --- 設定資料 ---------------------------------------
+    if kind == "美術":
+        info   = tokenize(name)              # [作者] があれば拾う
+        author = info.author                 # 無ければ空文字
+        title  = info.title or name          # タイトルはそのまま
+        today  = YMD
+        # [作者] が取れたら `[作者][出版社](不明)`、無ければ `[出版社](不明)`
+        prefix = f"[{author}][出版社]({today})" if author else f"[作者][出版社]({today})"
+        return (f"{tag}{prefix}{title}" if tag else f"{prefix}{title}"), None
+    # --- コミック / CG ---------------------------------
+    if kind == "コミック":
+        info = tokenize(name)
+        title  = format_comic({"author": info.author, "title": info.title, "volume": info.volume})
+        return title, None
+    # --- 成年 ------------------------------------------
+    if kind in {"成年コミック", "電子成年コミック"}:
+        info = tokenize(name)
+        author = info.author
+        title  = info.title or name
+        today  = YYMMDD
+        fixed  = f"[出版社](20{today})"
+        return f"{tag}[{author}]{fixed}{title}", None
+    # --- 同人（イベント名抽出）---------------------------
+    if kind in {"同人", "電子同人"}:
+        tokens = tokenize(name)
+        # 例: ... (サンクリ2024)  /  (COMIC1☆25) ...   無ければ yyyy-mm-dd
+        event = tokens.event or tokens.date or "イベント不明"
+
+        # ③ シリーズ名＝最後の (…)
+        series_raw = tokens.series
+        match = rules.series_match(series_raw, kind, stats)
+        series_short = match.short
+        unknown = unknown_label(series_raw, match)      # 未登録・あいまい一致はログへ
+
+        # ⑤ 作者・タイトル（タグを除いた名称から）
+        info   = tokenize_clean(tokens)
+        author = info.author
+        title  = _strip_series_suffix(info.title or tokens.clean, series_raw)  # 末尾の (シリーズ名) を除去
+
+        out = f"{tag}[{author}]({event}){title}"
+        if series_short:
+            out += f" ({series_short})"
+        return out, unknown
+
+    # --- その他（マッピング ＋ クリップ）---------------
+    for fmt, m in rules.iter_matches(kind, name, stats):
+        try:
+            mapped = fmt.format(*m.groups())
+            if kind == "成年雑誌":
+                # 月を 2 桁 0 埋め
+                mapped = _MONTH_RE.sub(lambda m: f'年{int(m.group(1)):02d}月', mapped)
+                mapped = _DAY_RE.sub(lambda m: f'-{int(m.group(1)):02d}', mapped)
+            if kind == "雑誌":
+                title  = tokenize(name).title or name
+                mapped = f"{mapped} {title}"
+            if stats is not None:
+                stats.outcome(kind, 'mapping')
+            return (f"{tag}{mapped}" if tag else mapped), None
+        except IndexError:
+            continue
+
+    base = rules.clip(kind, name, stats)
+    if base is not None:
+        if stats is not None:
+            stats.outcome(kind, 'clip')
+        return (f"{tag}{base}" if tag else base), None
+    if stats is not None:
+        stats.outcome(kind, 'default')
+    return DEFAULT_FILL, None
+
+# --- 種別ごとの一括変換（vectorized=True 用）---------------------------
+
+
+def _with_tag(tag: str, s: pd.Series) -> pd.Series:
+    return tag + s if tag else s
+
+
+def _pad_month_vec(s: pd.Series) -> pd.Series:
+    s = s.str.replace(_MONTH_RE, lambda m: f'年{int(m.group(1)):02d}月', regex=True)
+    return s.str.replace(_DAY_RE, lambda m: f'-{int(m.group(1)):02d}', regex=True)
+
+
+def _convert_kind_vec(kind: str, names: pd.Series, rules: RuleEngine,
+                      stats: Optional[ConversionStats] = None):
+    """1 種別ぶんの名称列をまとめて変換する（convert_one と同じ分岐・同じ結果）。
+
+    (変換後テンプレート列, 未登録シリーズ列 or None) を返す。
+    """
+    tag = rules.tag(kind)
+
+    if tag in {"def"}:
+        return names, None
+    if kind in {"その他", "小説"}:
+        return _with_tag(tag, names), None
+    if kind == "美術":
+        info   = cp.parse_comic_names(names)
+        title  = info['title'].where(info['title'] != '', names)
+        today  = YMD
+        prefix = ('[' + info['author'] + f'][出版社]({today})').where(
+            info['author'] != '', f"[作者][出版社]({today})")
+        return _with_tag(tag, prefix + title), None
+    if kind == "コミック":
+        info = cp.parse_comic_names(names)
+        return pd.Series([format_comic(r) for r in info.to_dict('records')],
+                         index=names.index, dtype=object), None
+    if kind in {"成年コミック", "電子成年コミック"}:
+        info  = cp.parse_comic_names(names)
+        title = info['title'].where(info['title'] != '', names)
+        today = YYMMDD
+        return f"{tag}[" + info['author'] + f"][出版社](20{today})" + title, None
+    if kind in {"同人", "電子同人"}:
+        tokens = cp.tokenize_names(names)
+        as_series = lambda values: pd.Series(values, index=names.index, dtype=object)
+        event = as_series([t.event or t.date or "イベント不明" for t in tokens])
+
+        series_raw = as_series([t.series for t in tokens])
+        matches = [rules.series_match(s, kind, stats) for s in series_raw]
+        series_short = as_series([m.short for m in matches])
+        unknown = as_series([unknown_label(s, m) for s, m in zip(series_raw, matches)])
+
+        memo = {}                       # タグを除いた名称 → そのトークン
+        info = [memo.get(t.clean) or memo.setdefault(t.clean, tokenize_clean(t)) for t in tokens]
+        # タイトル末尾の (シリーズ名) を除去
+        title = as_series([_strip_series_suffix(c.title or t.clean, t.series) for t, c in zip(tokens, info)])
+        out = f"{tag}[" + as_series([c.author for c in info]) + "](" + event + ")" + title
+        return out.where(series_short == '', out + " (" + series_short + ")"), unknown
+
+    # --- マッピング ＋ クリップ -------------------------------------
+    mapped = pd.Series([rules.first_mapping(kind, n, stats) for n in names], index=names.index, dtype=object)
+    hit = mapped.notna()
+    if stats is not None:
+        stats.outcome(kind, 'mapping', int(hit.sum()))
+    if hit.any():
+        m = mapped[hit]
+        if kind == "成年雑誌":
+            m = _pad_month_vec(m)
+        if kind == "雑誌":
+            info = cp.parse_comic_names(names[hit])
+            m = m + " " + info['title'].where(info['title'] != '', names[hit])
+        mapped[hit] = _with_tag(tag, m)
+    rest = ~hit
+    if rest.any():
+        fill = pd.Series(DEFAULT_FILL, index=names.index[rest], dtype=object)
+        clipped = 0
+        if kind in rules.clips:
+            base = names[rest].map(lambda n: rules.clip(kind, n, stats))
+            fill = _with_tag(tag, base).where(base.notna(), fill)
+            clipped = int(base.notna().sum())
+        if stats is not None:
+            stats.outcome(kind, 'clip', clipped)
+            stats.outcome(kind, 'default', int(rest.sum()) - clipped)
+        mapped[rest] = fill
+    return mapped, None
+
+
+def _strip_series_suffix(title: str, series_raw: str) -> str:
+    # re.sub(r'\s*\(' + re.escape(series_raw) + r'\)\s*$', '', title).strip() と同じ
+    if not series_raw:
+        return title
+    body = title.rstrip()
+    suffix = f"({series_raw})"
+    if body.endswith(suffix):
+        title = body[:-len(suffix)]
+    return title.strip()
+
+
+def key_columns(df: pd.DataFrame):
+    """(種別, 名称) を str(...).strip() 済みの object 列で返す。"""
+    kinds = df['種別'].astype(object).map(str).str.strip()
+    names = df['名称'].astype(object).map(str).str.strip()
+    return kinds, names
+
+
+def convert_rows(kinds: pd.Series, names: pd.Series, stats: Optional[ConversionStats] = None):
+    """行ごとに convert_one を呼ぶ（既定の変換経路）。"""
+    rules = rule_engine.current()
+    if stats is None:
+        pairs = [convert_one(k, n, rules) for k, n in zip(kinds, names)]
+    else:
+        pairs = []
+        clock = time.perf_counter_ns
+        for k, n in zip(kinds, names):
+            t0 = clock()
+            pairs.append(convert_one(k, n, rules, stats))
+            stats.timed(k, clock() - t0)
+    out = pd.Series([p[0] for p in pairs], index=kinds.index, dtype=object)
+    unknown = pd.Series([p[1] for p in pairs], index=kinds.index, dtype=object)
+    return out, unknown
+
+
+def convert_vectorized(kinds: pd.Series, names: pd.Series, stats: Optional[ConversionStats] = None):
+    """種別でグループ化し、種別ごとに一括変換してから元の行順へ戻す。"""
+    out = np.empty(len(kinds), dtype=object)
+    unknown = np.full(len(kinds), None, dtype=object)
+    rules = rule_engine.current()
+    marked = np.fromiter((has_markers(n) for n in names), dtype=bool, count=len(names))
+    for kind, pos in kinds.groupby(kinds, sort=False).indices.items():
+        t0 = time.perf_counter_ns()
+        n_rows = len(pos)
+        if marked.any():
+            # トークンと同じ文字を含む名称（まれ）は 1 行ずつ convert_one で変換する
+            for p in pos[marked[pos]]:
+                out[p], unknown[p] = convert_one(kind, names.iloc[p], rules, stats)
+            pos = pos[~marked[pos]]
+        if len(pos):
+            values, unk = _convert_kind_vec(kind, names.iloc[pos], rules, stats)
+            out[pos] = values.to_numpy(dtype=object)
+            if unk is not None:
+                unknown[pos] = unk.to_numpy(dtype=object)
+        if stats is not None:
+            stats.timed(kind, time.perf_counter_ns() - t0, n_rows)
+    return (pd.Series(out, index=kinds.index, dtype=object),
+            pd.Series(unknown, index=kinds.index, dtype=object))
+
+
+def convert_cached(kinds: pd.Series, names: pd.Series, cache: TitleCache, convert_many):
+    """キャッシュに無い (種別, 名称) だけを convert_many で変換し、結果を登録する。"""
+    keys = pd.DataFrame({'kind': kinds, 'name': names}).drop_duplicates()
+    table = cache.get_many(zip(keys['kind'], keys['name']))
+
+    miss = keys[[(k, n) not in table for k, n in zip(keys['kind'], keys['name'])]]
+    if len(miss):
+        values, unknown = convert_many(miss['kind'], miss['name'])
+        unknown = unknown.where(unknown.notna(), None)
+        fresh = {(k, n): (v, u) for k, n, v, u in zip(miss['kind'], miss['name'], values, unknown)}
+        cache.put_many(fresh)
+        table.update(fresh)
+
+    pairs = [table[(k, n)] for k, n in zip(kinds, names)]
+    out = pd.Series([p[0] for p in pairs], index=kinds.index, dtype=object)
+    unknown = pd.Series([p[1] for p in pairs], index=kinds.index, dtype=object)
+    return out, unknown
+
+
+def render_templates(templates: pd.Series, now: datetime) -> pd.Series:
+    """テンプレート中の日付トークンを当日日付へ展開する（名称由来の ESC 付き文字はそのまま）。"""
+    out = (templates.str.replace(YMD, now.strftime('%Y%m%d'), regex=False)
+                    .str.replace(YYMMDD, now.strftime('%y%m%d'), regex=False))
+    escaped = templates.str.contains(ESC, regex=False).fillna(False).astype(bool)
+    if escaped.any():
+        out[escaped] = [render_template(t, now) for t in templates[escaped]]
+    return out
+
+
+# --- プロセスプールでのシャード並列 -----------------------------------------
+DEFAULT_SHARD_SIZE = 20_000
+
+
+def _convert_shard(kinds: list, names: list, vectorized: bool, with_stats: bool = False):
+    """ワーカー側で 1 シャードを変換する。
+
+    ワーカーには文字列のリストだけを渡す。ルールはワーカー内の共有エンジンが
+    最初のシャードで 1 回だけコンパイルし、以降のシャードでは使い回す。
+    """
+    convert_many = convert_vectorized if vectorized else convert_rows
+    stats = ConversionStats() if with_stats else None
+    out, unknown = convert_many(pd.Series(kinds, dtype=object), pd.Series(names, dtype=object), stats)
+    return out.tolist(), unknown.where(unknown.notna(), None).tolist(), stats
+
+
+def convert_parallel(kinds: pd.Series, names: pd.Series, workers=None,
+                     shard_size: int = DEFAULT_SHARD_SIZE, vectorized: bool = False,
+                     stats: Optional[ConversionStats] = None,
+                     pool: Optional[ProcessPoolExecutor] = None):
+    """shard_size 行ずつに分けて ProcessPoolExecutor で変換し、元の行順で結合する。
+
+    pool を渡すとそのプールを使う（呼び出し側で閉じる。スライス・チャンクごとに呼ぶとき用）。
+    """
+    shard_size = max(int(shard_size), 1)
+    if workers == 1 or len(kinds) <= shard_size:
+        return (convert_vectorized if vectorized else convert_rows)(kinds, names, stats)
+
+    kind_list, name_list = kinds.tolist(), names.tolist()
+    starts = range(0, len(kind_list), shard_size)
+    shards = ([kind_list[i:i + shard_size] for i in starts],
+              [name_list[i:i + shard_size] for i in starts],
+              [vectorized] * len(starts),
+              [stats is not None] * len(starts))
+    if pool is not None:
+        parts = list(pool.map(_convert_shard, *shards))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_convert_shard, *shards))
+
+    out = [v for part, _, _ in parts for v in part]
+    unknown = [u for _, part, _ in parts for u in part]
+    if stats is not None:
+        for _, _, shard_stats in parts:
+            stats.merge(shard_stats)
+    return (pd.Series(out, index=kinds.index, dtype=object),
+            pd.Series(unknown, index=kinds.index, dtype=object))
@@ -0,0 +1,115 @@
+"""utils/tsv_loader.py
+
+rename.tsv の読み込み（文字コード判定 + デコードを 1 回で済ませる）。
+
+判定順:
+1. BOM（utf-8-sig / utf-16）
+2. バッファ全体を utf-8 として厳密にデコード
+3. 同じく cp932 としてデコード
+4. chardet で推定し、デコードできないバイトは捨てて件数を数える
+
+ファイルはディスクから 1 回だけ読み、デコード済みテキストを
+そのまま pandas へ渡す（失敗するたびに読み直すことはしない）。
+chardet は 4. まで来たときだけ import する。
+"""
+
+import codecs
+import io
+import threading
+from dataclasses import dataclass
+from typing import Tuple
+
+import pandas as pd
+
+__all__ = ['LoadInfo', 'decode_bytes', 'read_tsv', 'sniff_encoding']
+
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+_STRICT_CANDIDATES = ('utf-8', 'cp932')
+
+# デコードできなかったバイト数を数えつつ読み飛ばすエラーハンドラ
+_bad = threading.local()
+
+
+def _count_and_skip(err: UnicodeDecodeError):
+    _bad.count = getattr(_bad, 'count', 0) + (err.end - err.start)
+    return '', err.end
+
+
+codecs.register_error('tsv_loader.count', _count_and_skip)
+
+
+@dataclass
+class LoadInfo:
+    encoding: str
+    bad_bytes: int = 0       # デコードできずに捨てたバイト数
+    size: int = 0            # 入力バイト数
+
+    def summary(self) -> str:
+        return f"encoding={self.encoding} / 不正バイト {self.bad_bytes} / {self.size} bytes"
+
+
+def decode_bytes(raw: bytes) -> Tuple[str, LoadInfo]:
+    """バイト列の文字コードを判定し、1 回だけデコードして返す。"""
+    _bad.count = 0
+    for bom, enc in _BOMS:
+        if raw.startswith(bom):
+            return raw.decode(enc, errors='tsv_loader.count'), _info(enc, len(raw))
+
+    for enc in _STRICT_CANDIDATES:
+        try:
+            return raw.decode(enc), LoadInfo(enc, 0, len(raw))
+        except UnicodeDecodeError:
+            continue
+
+    enc = _detect(raw)
+    return raw.decode(enc, errors='tsv_loader.count'), _info(enc, len(raw))
+
+
+def _detect(raw: bytes) -> str:
+    import chardet
+    return chardet.detect(raw)['encoding'] or 'utf-8'
+
+
+def _info(enc: str, size: int) -> LoadInfo:
+    return LoadInfo(enc, _bad.count, size)
+
+
+def read_tsv(path: str, **read_csv_kwargs) -> Tuple[pd.DataFrame, LoadInfo]:
+    """TSV を 1 回だけ読み込み、判定した文字コードでデコードして DataFrame にする。"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    text, info = decode_bytes(raw)
+    del raw
+    df = pd.read_csv(io.StringIO(text), sep='\t', **read_csv_kwargs)
+    return df, info
+
+
+def sniff_encoding(path: str, block_size: int = 1 << 20) -> str:
+    """ファイルを少しずつデコードして文字コードだけを判定する（ストリーミング用）。
+
+    全体をメモリに載せないため、chardet にはファイル先頭だけを渡す。
+    """
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    for bom, enc in _BOMS:
+        if head.startswith(bom):
+            return enc
+
+    for enc in _STRICT_CANDIDATES:
+        decoder = codecs.getincrementaldecoder(enc)()
+        try:
+            with open(path, 'rb') as f:
+                while block := f.read(block_size):
+                    decoder.decode(block)
+            decoder.decode(b'', final=True)
+            return enc
+        except UnicodeDecodeError:
+            continue
+
+    with open(path, 'rb') as f:
+        raw = f.read(block_size)
+    return _detect(raw)
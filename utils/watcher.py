@@ -0,0 +1,263 @@
+"""utils/watcher.py
+
+常駐モード: 入力ディレクトリを監視し、置かれたファイルをその場で変換する。
+リポジトリ直下で実行する:
+
+    python -m utils.watcher --titles-in inbox --titles-out output
+    python -m utils.watcher --pdf-root pdf --pdf-kwargs '{"workers": 2}'
+    python -m utils.watcher --titles-in inbox --titles-out output --pdf-root pdf --workers 4
+
+- titles : --titles-in の *.tsv（rename.tsv など）を normalize_titles で変換し、
+           --titles-out（既定は <titles-in>/output）/<元ファイル名>_out.tsv に書き出す
+           （--titles-out に --titles-in と同じディレクトリは指定できない。出力をまた入力として拾うため）
+- pdf    : --pdf-root/input/*.pdf が増えた・変わったら pdf_to_csv_fixed を実行する
+           （変わっていない PDF はマニフェストで飛ばされる。同時に走るのは 1 本だけ）
+
+ファイルは (mtime, サイズ) が --settle 秒変わらなくなってから処理する（書き込み途中を拾わない）。
+処理は --workers 本のスレッドで非同期に行い、同じファイルは同時に 2 本走らせない
+（処理中に更新されたら、終わったあともう一度処理する）。
+プロセスは常駐したままなので、import・ルールのコンパイル（rule_engine）は最初の 1 回だけ。
+mapping_config / utils を書き換えた場合は、次のファイルから rule_engine が読み直す。
+
+watchdog が入っていれば inotify などのイベントで即座に走査し、無ければ --interval 秒ごとに走査する。
+起動時の最初の走査に限り、出力が入力より新しい TSV は処理済みとみなす（起動後に置かれた・
+置き換えられたファイルは、mtime を保ったコピーでも必ず処理する）。
+"""
+
+import argparse
+import json
+import runpy
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+__all__ = ['Watcher']
+
+ROOT = Path(__file__).resolve().parent.parent
+TITLES_BLOCK = 'transformers/book_title_transformer.py'
+PDF_BLOCK = 'transformers/pdf_to_csv.py'
+PDF_JOB = '<pdf>'                       # PDF はファイル単位ではなく input/ 単位で 1 本にまとめる
+
+Stamp = Tuple[int, int]                 # (mtime_ns, size)
+
+
+def _stamp(path: Path) -> Optional[Stamp]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _is_temporary(path: Path) -> bool:
+    return path.name.startswith(('.', '~')) or path.suffix in ('.tmp', '.part')
+
+
+class Watcher:
+    """入力ディレクトリを走査し、落ち着いたファイルをスレッドプールで処理する。"""
+
+    def __init__(self, titles_in: Optional[str] = None, titles_out: Optional[str] = None,
+                 pdf_root: Optional[str] = None, workers: int = 2, interval: float = 1.0,
+                 settle: float = 1.0, title_kwargs: Optional[dict] = None,
+                 pdf_kwargs: Optional[dict] = None):
+        if not titles_in and not pdf_root:
+            raise ValueError('titles_in か pdf_root のどちらかは指定してください')
+        self.titles_in = Path(titles_in).resolve() if titles_in else None
+        self.titles_out = (Path(titles_out) if titles_out else Path(titles_in) / 'output').resolve() if titles_in else None
+        if self.titles_in is not None and self.titles_out == self.titles_in:
+            raise ValueError(f'titles_out に titles_in と同じディレクトリは指定できません: {self.titles_out}')
+        self.pdf_root = Path(pdf_root).resolve() if pdf_root else None
+        self.interval = interval
+        self.settle = settle
+        self.title_kwargs = title_kwargs or {}
+        self.pdf_kwargs = pdf_kwargs or {}
+
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='watch')
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._seen: Dict[Path, Tuple[Stamp, float]] = {}    # 観測中の stamp と、その stamp を最初に見た時刻
+        self._done: Dict[Path, Stamp] = {}                  # 処理済みの stamp
+        self._running: Dict[str, bool] = {}                 # ジョブキー → 処理中に再度変化したか
+        self._initial = True                                # まだ最初の走査をしていないか
+        self.processed = 0
+        self.failed = 0
+
+    # --- 走査 ---
+
+    def _candidates(self):
+        if self.titles_in is not None and self.titles_in.is_dir():
+            for path in self.titles_in.glob('*.tsv'):
+                if not _is_temporary(path):
+                    yield 'titles', path
+        if self.pdf_root is not None and (self.pdf_root / 'input').is_dir():
+            for path in (self.pdf_root / 'input').glob('*.pdf'):
+                if not _is_temporary(path):
+                    yield 'pdf', path
+
+    def _already_done(self, kind: str, path: Path, stamp: Stamp) -> bool:
+        """起動直後（最初の走査）に見つけたファイルを処理済みとみなすか。"""
+        if kind == 'titles':
+            out = _stamp(self._output_path(path))
+            return out is not None and out[0] >= stamp[0]
+        return False                    # PDF はマニフェストが判定する
+
+    def scan(self, now: Optional[float] = None) -> int:
+        """落ち着いたファイルのジョブを投入し、投入した数を返す。"""
+        now = time.monotonic() if now is None else now
+        jobs: Dict[str, Tuple[str, Optional[Path]]] = {}
+        with self._lock:
+            present = set()
+            for kind, path in self._candidates():
+                present.add(path)
+                stamp = _stamp(path)
+                if stamp is None or self._done.get(path) == stamp:
+                    continue
+                seen = self._seen.get(path)
+                if seen is None or seen[0] != stamp:
+                    if self._initial and self._already_done(kind, path, stamp):
+                        self._done[path] = stamp
+                        continue
+                    self._seen[path] = (stamp, now)
+                    continue
+                if now - seen[1] < self.settle:
+                    continue
+                self._done[path] = stamp
+                del self._seen[path]
+                key = PDF_JOB if kind == 'pdf' else str(path)
+                jobs[key] = (kind, None if kind == 'pdf' else path)
+            self._initial = False
+            for path in [p for p in self._done if p not in present]:
+                del self._done[path]            # 消えたファイルは忘れる（同じ stamp で置き直されても処理する）
+            for path in [p for p in self._seen if p not in present]:
+                del self._seen[path]
+
+            submitted = 0
+            for key, (kind, path) in jobs.items():
+                if key in self._running:
+                    self._running[key] = True       # 終わったらもう一度
+                    continue
+                self._running[key] = False
+                self._pool.submit(self._run, key, kind, path)
+                submitted += 1
+        return submitted
+
+    # --- 処理 ---
+
+    def _output_path(self, path: Path) -> Path:
+        return self.titles_out / f"{path.stem}_out.tsv"
+
+    def _block(self, relpath: str) -> dict:
+        """ブロックを読み込む。import 済みのモジュールは使い回され、ルールも温まったまま。
+
+        毎回読み直すので、ブロック冒頭の reload_if_changed() でソースの変更も反映される。
+        """
+        identity = lambda f: f
+        with self._load_lock:
+            return runpy.run_path(str(ROOT / relpath), init_globals={'transformer': identity, 'test': identity})
+
+    def _run(self, key: str, kind: str, path: Optional[Path]) -> None:
+        while True:
+            started = time.perf_counter()
+            try:
+                if kind == 'titles':
+                    data = {'input_path': str(path), 'output_path': str(self._output_path(path))}
+                    self._block(TITLES_BLOCK)['normalize_titles'](data, **self.title_kwargs)
+                    label = path.name
+                else:
+                    # 常駐側は結合結果を使わないので、_merged.csv だけ更新して DataFrame は作らない
+                    pdf_kwargs = {'merge': 'file', **self.pdf_kwargs, 'root': str(self.pdf_root)}
+                    self._block(PDF_BLOCK)['pdf_to_csv_fixed'](**pdf_kwargs)
+                    label = 'input/*.pdf'
+                print(f"[WATCH] ✔ {label} ({time.perf_counter() - started:.1f}s)", flush=True)
+                self.processed += 1
+            except Exception as e:      # 1 ファイルの失敗で常駐を止めない（ファイルが変われば再処理）
+                print(f"[WATCH] ✖ {path or key}: {type(e).__name__}: {e}", flush=True)
+                self.failed += 1
+            with self._lock:
+                if not self._running.get(key):
+                    del self._running[key]
+                    return
+                self._running[key] = False
+
+    @property
+    def busy(self) -> bool:
+        with self._lock:
+            return bool(self._running or self._seen)
+
+    # --- ループ ---
+
+    def _observe(self):
+        if Observer is None:
+            return None
+        wake = self._wake
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                wake.set()
+
+        observer = Observer()
+        for d in (self.titles_in, self.pdf_root / 'input' if self.pdf_root else None):
+            if d is not None and d.is_dir():
+                observer.schedule(_Handler(), str(d), recursive=False)
+        observer.start()
+        return observer
+
+    def run(self, stop: Optional[threading.Event] = None, once: bool = False) -> None:
+        """stop がセットされるまで（once=True なら今あるファイルを処理し終えるまで）監視する。"""
+        stop = stop or threading.Event()
+        observer = self._observe()
+        dirs = [str(d) for d in (self.titles_in, self.pdf_root) if d]
+        print(f"[WATCH] {', '.join(dirs)} を監視します"
+              f"（{'watchdog' if observer else f'{self.interval:g} 秒ごとに走査'}）", flush=True)
+        try:
+            while not stop.is_set():
+                self.scan()
+                if once and not self.busy:
+                    break
+                # 落ち着くのを待っている間は settle 刻みで見直す
+                timeout = min(self.interval, self.settle) if self._seen else self.interval
+                if self._wake.wait(timeout):
+                    self._wake.clear()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            self._pool.shutdown(wait=True)
+            print(f"[WATCH] 終了（処理 {self.processed} / 失敗 {self.failed}）", flush=True)
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog='python -m utils.watcher', description=__doc__.split('\n\n')[0])
+    ap.add_argument('--titles-in', help='rename.tsv などを置くディレクトリ')
+    ap.add_argument('--titles-out', help='変換結果の出力先（既定は <titles-in>/output）')
+    ap.add_argument('--pdf-root', help='input/ と output/ を持つ PDF 用ディレクトリ')
+    ap.add_argument('--workers', type=int, default=2, help='同時に処理するファイル数')
+    ap.add_argument('--interval', type=float, default=1.0, help='走査間隔（秒）')
+    ap.add_argument('--settle', type=float, default=1.0, help='この秒数変化が無ければ書き込み完了とみなす')
+    ap.add_argument('--title-kwargs', default='{}', help='normalize_titles に渡す kwargs（JSON）')
+    ap.add_argument('--pdf-kwargs', default='{}', help='pdf_to_csv_fixed に渡す kwargs（JSON）')
+    ap.add_argument('--once', action='store_true', help='今あるファイルを処理したら終了する')
+    args = ap.parse_args(argv)
+
+    watcher = Watcher(args.titles_in, args.titles_out, args.pdf_root, workers=args.workers,
+                      interval=args.interval, settle=args.settle,
+                      title_kwargs=json.loads(args.title_kwargs), pdf_kwargs=json.loads(args.pdf_kwargs))
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())      # 処理中のジョブは終わらせてから止める
+    watcher.run(stop, once=args.once)
+
+
+if __name__ == '__main__':
+    main()